@@ -3,11 +3,13 @@
 配置管理器 - 管理应用配置包括API设置
 """
 
-import json
 import os
+import shutil
 from typing import Dict, Any, Optional
 import logging
 
+import orjson
+
 from path_manager import path_manager
 
 logger = logging.getLogger(__name__)
@@ -28,6 +30,8 @@ class ConfigManager:
         self.config_file_writable = path_manager.writable_base_path / config_file
         self.config_file_resource = path_manager.get_resource_path(config_file)
         self.config_file = self.config_file_writable
+        # 配置是否有未保存的修改，没有修改时save_config不写文件
+        self._dirty = False
         self.config = self._load_config()
     
     def _load_config(self) -> Dict[str, Any]:
@@ -48,53 +52,60 @@ class ConfigManager:
         # 优先从可写目录加载配置
         if self.config_file_writable.exists():
             try:
-                with open(self.config_file_writable, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
-                    # 合并默认配置和加载的配置
-                    self._merge_config(default_config, loaded_config)
-                    logger.info(f"从可写目录加载配置: {self.config_file_writable}")
-                    return default_config
+                # 直接以字节读入交给orjson解析，省去文本解码层
+                loaded_config = orjson.loads(self.config_file_writable.read_bytes())
+                # 合并默认配置和加载的配置
+                self._merge_config(default_config, loaded_config)
+                logger.info(f"从可写目录加载配置: {self.config_file_writable}")
+                return default_config
             except Exception as e:
                 logger.warning(f"加载可写配置文件失败: {e}")
         
         # 如果可写目录没有配置文件，尝试从资源目录复制
         if self.config_file_resource.exists():
             try:
-                with open(self.config_file_resource, 'r', encoding='utf-8') as f:
-                    loaded_config = json.load(f)
-                    self._merge_config(default_config, loaded_config)
-                    logger.info(f"从资源目录加载配置: {self.config_file_resource}")
-                    # 保存到可写目录
-                    self.save_config()
-                    return default_config
+                loaded_config = orjson.loads(self.config_file_resource.read_bytes())
+                self._merge_config(default_config, loaded_config)
+                logger.info(f"从资源目录加载配置: {self.config_file_resource}")
+                # 原样复制到可写目录，无需重新序列化
+                self.config_file_writable.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(self.config_file_resource, self.config_file_writable)
+                return default_config
             except Exception as e:
                 logger.warning(f"加载资源配置文件失败: {e}")
         
         # 如果都没有，使用默认配置并保存
         logger.info("使用默认配置")
         self.config = default_config
+        self._dirty = True
         self.save_config()
         return default_config
     
     def _merge_config(self, default: Dict[str, Any], loaded: Dict[str, Any]):
-        """递归合并配置"""
+        """合并配置：配置只有两层（openai/ui等分组），分组内直接用dict.update覆盖"""
         for key, value in loaded.items():
-            if key in default:
-                if isinstance(default[key], dict) and isinstance(value, dict):
-                    self._merge_config(default[key], value)
-                else:
-                    default[key] = value
+            if isinstance(value, dict) and isinstance(default.get(key), dict):
+                default[key].update(value)
             else:
                 default[key] = value
     
     def save_config(self) -> bool:
-        """保存配置到可写目录"""
+        """保存配置到可写目录（配置未修改时跳过写入）"""
+        if not self._dirty:
+            return True
         try:
             # 确保目录存在
             self.config_file_writable.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(self.config_file_writable, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
+            # 一次编码、直接写入字节；配置中含API密钥，权限设为仅当前用户可读写
+            data = memoryview(orjson.dumps(self.config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            fd = os.open(str(self.config_file_writable), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+            self._dirty = False
             logger.info(f"配置已保存到: {self.config_file_writable}")
             return True
         except Exception as e:
@@ -110,6 +121,7 @@ class ConfigManager:
         self.config["openai"]["api_key"] = api_key
         self.config["openai"]["base_url"] = base_url
         self.config["openai"]["model"] = model
+        self._dirty = True
     
     def get_ui_config(self) -> Dict[str, Any]:
         """获取UI配置"""
@@ -119,16 +131,20 @@ class ConfigManager:
         """设置UI配置"""
         for key, value in kwargs.items():
             self.config["ui"][key] = value
+        self._dirty = True
     
     def apply_to_environment(self):
         """将OpenAI配置应用到环境变量"""
         openai_config = self.get_openai_config()
-        if openai_config.get("api_key"):
-            os.environ["OPENAI_API_KEY"] = openai_config["api_key"]
-        if openai_config.get("base_url"):
-            os.environ["OPENAI_BASE_URL"] = openai_config["base_url"]
-        if openai_config.get("model"):
-            os.environ["OPENAI_MODEL"] = openai_config["model"]
+        os.environ.update({
+            env_name: value
+            for env_name, value in (
+                ("OPENAI_API_KEY", openai_config.get("api_key")),
+                ("OPENAI_BASE_URL", openai_config.get("base_url")),
+                ("OPENAI_MODEL", openai_config.get("model")),
+            )
+            if value
+        })
     
     def is_openai_configured(self) -> bool:
         """检查OpenAI配置是否完整"""
@@ -137,3 +153,6 @@ class ConfigManager:
                    openai_config.get("base_url") and 
                    openai_config.get("model"))
 
+
+# 创建一个全局实例供项目其他模块使用（配置只在首次导入时读取一次）
+config_manager = ConfigManager()
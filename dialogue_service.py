@@ -3,16 +3,20 @@
 对话服务系统 - 支持Excel分析和PPT生成
 """
 
-import json
 import os
+import re
 import asyncio
 import logging
 from typing import Dict, List, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import traceback
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate, chain
 
-from llm_client import OpenAIConnector
+import orjson
+
+from llm_client import OpenAIConnector, ToolSession, get_background_loop
 from tools.db import ExcelAnalysisOrchestrator
 from tools.create_ppt_simplified import create_pptx_from_json
 from tools.tool_registry import ToolRegistry
@@ -32,6 +36,149 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@dataclass
+class PPTResult:
+    """PPT生成结果：给用户看的消息文本，以及生成成功时的文件路径"""
+    text: str
+    file_path: Optional[str] = None
+
+
+# 匹配LLM输出外层的markdown代码块标记（```json ... ```），一次扫描取出内部JSON
+_FENCE_RE = re.compile(r'\A\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*\Z', re.S)
+
+
+# 同一章节中合并到一次LLM对话里生成的内容页数量
+SLIDE_BATCH_SIZE = 4
+
+# 同时进行中的内容页生成请求上限
+MAX_CONCURRENT_SLIDE_REQUESTS = 32
+
+
+# 全局系统提示：指导LLM如何使用变量占位符，避免回传海量数据（每个对话历史都以它开头）
+_BASE_SYSTEM_MSGS = (
+    {
+        "role": "system",
+        "content": (
+            "当你调用工具并收到包含 variable_binding 的结果时，不要在回复中直接展开原始数据。"
+            "如需引用完整数据，请在最终回答中使用占位符形式 {\"<工具名>\":\"<变量名>\"}。"
+            "若需要对大数据进行进一步聚合/筛选/排序，请描述操作或再次调用工具，而不是复制粘贴原始数据。"
+        )
+    },
+)
+
+# 单页内容生成prompt模板（模块加载时构建一次，调用时用format_map填充）
+_PAGE_PROMPT_TMPL = """
+任务：为PPT页面生成具体内容
+
+主要目标：{main_objective}
+章节：{section_title}
+页面标题：{slide_title}
+分析类型：{analysis_type}
+图表类型：{chart_type}
+数据需求：{data_query}
+关键要点：
+{key_points}
+
+数据上下文：
+{data_context}
+
+要求：
+1. 如果需要数据，首先使用execute_sql工具查询所需数据，调用工具最大轮次为10次
+2. 基于查询结果生成内容，内容要有洞察力和价值
+3. 必须返回JSON格式，格式如下：
+
+```json
+{{
+    "text": "这里是对数据的分析说明，要有具体的数据支撑，1-2段话",
+    "bullet_points": [
+        "第一个关键发现或洞察",
+        "第二个关键发现或洞察",
+        "第三个关键发现或洞察"
+    ],
+    "chart": {{
+        "type": "{chart_type}",
+        "title": "图表标题",
+        "data": {{
+            "categories": ["类别1", "类别2", "类别3"],
+            "series": {{
+                "系列名称1": [数值1, 数值2, 数值3],
+                "系列名称2": [数值1, 数值2, 数值3]
+            }}
+        }}
+    }}
+}}
+```
+
+注意：
+- text字段必须包含具体的分析内容，不能为空
+- bullet_points必须是3-5个要点的数组
+- 如果chart_type是"none"，则不需要chart字段
+- 如果需要图表，确保data中的categories数量与每个series的数值数量一致
+- 返回的必须是纯JSON，不要包含```json标记
+
+请确保内容与分析类型和数据相符，提供有价值的洞察。
+""".format_map
+
+# 同章节多页批量生成prompt模板
+_BATCH_PROMPT_TMPL = """
+任务：为同一章节下的多个PPT页面生成具体内容
+
+主要目标：{main_objective}
+章节：{section_title}
+页面列表（JSON数组，按顺序）：
+{pages_json}
+
+数据上下文：
+{data_context}
+
+要求：
+1. 如果需要数据，首先使用execute_sql工具查询所需数据，可在一次回复中并行调用多个查询，调用工具最大轮次为10次
+2. 基于查询结果为每个页面分别生成内容，内容要有洞察力和价值
+3. 必须返回JSON格式，slides数组与页面列表一一对应、顺序一致、数量相同，格式如下：
+
+```json
+{{
+    "slides": [
+        {{
+            "index": 1,
+            "text": "这里是对数据的分析说明，要有具体的数据支撑，1-2段话",
+            "bullet_points": [
+                "第一个关键发现或洞察",
+                "第二个关键发现或洞察",
+                "第三个关键发现或洞察"
+            ],
+            "chart": {{
+                "type": "该页面的图表类型",
+                "title": "图表标题",
+                "data": {{
+                    "categories": ["类别1", "类别2", "类别3"],
+                    "series": {{
+                        "系列名称1": [数值1, 数值2, 数值3]
+                    }}
+                }}
+            }}
+        }}
+    ]
+}}
+```
+
+注意：
+- 每个页面的text字段必须包含具体的分析内容，不能为空
+- 每个页面的bullet_points必须是3-5个要点的数组
+- 如果页面的chart_type是"none"，则该页面不需要chart字段
+- 如果需要图表，确保data中的categories数量与每个series的数值数量一致
+- 返回的必须是纯JSON，不要包含```json标记
+
+请确保内容与各页面的分析类型和数据相符，提供有价值的洞察。
+""".format_map
+
+
+@lru_cache(maxsize=1)
+def _load_outline_prompt() -> str:
+    """读取结构化大纲prompt模板（进程内只读取一次）"""
+    prompt_path = path_manager.get_resource_path('prompts/prompt_outline.txt')
+    return prompt_path.read_text(encoding='utf-8')
+
 
 class DialogueService:
     """
@@ -54,16 +201,11 @@ class DialogueService:
             ValueError: JSON解析失败时抛出，调用方需要处理
         """
         # 清理markdown格式
-        cleaned = content.strip()
-        if cleaned.startswith("```json"):
-            cleaned = cleaned[7:]
-        if cleaned.endswith("```"):
-            cleaned = cleaned[:-3]
-        cleaned = cleaned.strip()
+        cleaned = _FENCE_RE.match(content).group(1)
         
         try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError as e:
+            return orjson.loads(cleaned)
+        except orjson.JSONDecodeError as e:
             # 记录详细错误信息
             logger.error(f"JSON解析失败 [{context}]: {e}")
             logger.error(f"原始内容: {content[:200]}...")
@@ -76,32 +218,22 @@ class DialogueService:
         # 初始化LLM客户端（模型配置在llm_client中通过环境变量处理）
         self.llm_client = OpenAIConnector()
         
-        # 初始化工具注册器并设置到LLM客户端
+        # 初始化工具注册器
         self.tool_registry = ToolRegistry()
         self._setup_tools()
-        self.llm_client.set_tool_registry(self.tool_registry)
+        # 本会话的工具状态（工具注册器、执行上下文、变量处理器和结果缓存），每次调用LLM时传入，不与其他会话共享
+        self.tool_session = ToolSession(self.tool_registry)
         
         # 存储当前的Excel分析器
         self.excel_orchestrator: Optional[ExcelAnalysisOrchestrator] = None
+        # 当前Excel的数据上下文（加载时生成一次，后续复用）
+        self._cached_context: Optional[str] = None
         
-        # 对话历史
-        self.conversation_history: List[Dict[str, str]] = []
+        # 对话历史（以全局系统提示开头）
+        self.conversation_history: List[Dict[str, str]] = list(_BASE_SYSTEM_MSGS)
         
-        # 线程池用于并行处理
-        self.executor = ThreadPoolExecutor(max_workers=10)
-
-        # 消息变量占位符处理器（与llm_client保持同一个实例）
-        self.message_var_processor: MessageVariableProcessor = self.llm_client.message_var_processor
-
-        # 全局系统提示：指导LLM如何使用变量占位符，避免回传海量数据
-        self.conversation_history.append({
-            "role": "system",
-            "content": (
-                "当你调用工具并收到包含 variable_binding 的结果时，不要在回复中直接展开原始数据。"
-                "如需引用完整数据，请在最终回答中使用占位符形式 {\"<工具名>\":\"<变量名>\"}。"
-                "若需要对大数据进行进一步聚合/筛选/排序，请描述操作或再次调用工具，而不是复制粘贴原始数据。"
-            )
-        })
+        # 消息变量占位符处理器（与本会话的工具状态保持同一个实例）
+        self.message_var_processor: MessageVariableProcessor = self.tool_session.message_var_processor
         
     def _setup_tools(self):
         """设置LLM可用的工具"""
@@ -120,11 +252,13 @@ class DialogueService:
             数据上下文描述
         """
         try:
-            self.excel_orchestrator = ExcelAnalysisOrchestrator(excel_path)
-            context = self.excel_orchestrator.get_llm_context()
+            orchestrator = ExcelAnalysisOrchestrator(excel_path)
+            context = orchestrator.get_llm_context()
+            self.excel_orchestrator = orchestrator
+            self._cached_context = context
             
-            # 更新LLM客户端的工具上下文
-            self.llm_client.update_tool_context({
+            # 更新本会话的工具上下文
+            self.tool_session.update_context({
                 "excel_orchestrator": self.excel_orchestrator
             })
             
@@ -140,7 +274,7 @@ class DialogueService:
     
 
     
-    def _generate_ppt_outline(self, user_requirement: str, data_context: str) -> Dict[str, Any]:
+    async def _generate_ppt_outline(self, user_requirement: str, data_context: str) -> Dict[str, Any]:
         """
         根据用户需求和数据生成PPT大纲
         
@@ -154,9 +288,7 @@ class DialogueService:
         logger.info("开始生成PPT大纲")
         
         # 读取结构化大纲prompt模板
-        prompt_path = path_manager.get_resource_path('prompts/prompt_outline.txt')
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            prompt_template = f.read()
+        prompt_template = _load_outline_prompt()
         
         # 构建完整的prompt
         messages = [
@@ -176,17 +308,18 @@ class DialogueService:
         
         # 调用LLM生成大纲
         try:
-            response = self.llm_client.chat_completion(
+            response = await self.llm_client.achat_completion(
                 messages=messages,
                 temperature=0.3,  # 降低温度以获得更稳定的JSON输出
                 max_tokens=4096,
-                auto_execute_tools=False  # 大纲生成不需要工具调用
+                auto_execute_tools=False,  # 大纲生成不需要工具调用
+                tool_session=self.tool_session
             )
             
             outline_text = response.choices[0].message.content
 
             # 在解析JSON前，先替换占位符（理论上大纲不含，但保持一致性）
-            outline_text = self.message_var_processor.resolve_placeholders_in_text(outline_text)
+            outline_text = self.message_var_processor.resolve_placeholders_in_text(outline_text, render="json")
             
             # 解析JSON格式的大纲
             try:
@@ -201,7 +334,55 @@ class DialogueService:
             logger.error(f"生成大纲失败: {traceback.format_exc()}")
             raise
     
-    def _generate_slide_content(self, section_title: str, subsection: Dict[str, Any], 
+    def _build_slide_data(self, subsection: Dict[str, Any], llm_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将LLM返回的页面JSON转换为幻灯片数据结构
+        
+        参数:
+            subsection: 子章节信息
+            llm_data: LLM返回并解析后的页面内容
+            
+        返回:
+            幻灯片内容
+        """
+        # 直接构建幻灯片数据结构
+        slide_data = {
+            "type": "content",
+            "title": subsection.get('subsection_title', ''),
+            "contents": []
+        }
+        
+        # 添加文本内容
+        text_content = llm_data.get("text", "")
+        bullet_points = llm_data.get("bullet_points", [])
+        
+        # 确保bullet_points是列表
+        if isinstance(bullet_points, str):
+            bullet_points = [bullet_points]
+        
+        # 如果有文本内容或要点，添加文本部分
+        if text_content or bullet_points:
+            slide_data["contents"].append({
+                "type": "text",
+                "text": text_content,
+                "bullet_points": bullet_points
+            })
+        
+        # 添加图表内容
+        chart_info = llm_data.get("chart")
+        if chart_info and isinstance(chart_info, dict):
+            chart_data = chart_info.get("data", {})
+            if chart_data.get("categories") and chart_data.get("series"):
+                slide_data["contents"].append({
+                    "type": "chart",
+                    "chart_type": chart_info.get("type", "column"),
+                    "chart_title": chart_info.get("title", ""),
+                    "data": chart_data
+                })
+        
+        return slide_data
+    
+    async def _generate_slide_content(self, section_title: str, subsection: Dict[str, Any], 
                                data_context: str, main_objective: str) -> Dict[str, Any]:
         """
         为单个幻灯片生成内容
@@ -224,57 +405,16 @@ class DialogueService:
         data_query = subsection.get("data_query", "")
         
         # 构建页面生成prompt
-        page_prompt = f"""
-任务：为PPT页面生成具体内容
-
-主要目标：{main_objective}
-章节：{section_title}
-页面标题：{subsection.get('subsection_title', '')}
-分析类型：{analysis_type}
-图表类型：{chart_type}
-数据需求：{data_query}
-关键要点：
-{key_points}
-
-数据上下文：
-{data_context}
-
-要求：
-1. 如果需要数据，首先使用execute_sql工具查询所需数据，调用工具最大轮次为10次
-2. 基于查询结果生成内容，内容要有洞察力和价值
-3. 必须返回JSON格式，格式如下：
-
-```json
-{{
-    "text": "这里是对数据的分析说明，要有具体的数据支撑，1-2段话",
-    "bullet_points": [
-        "第一个关键发现或洞察",
-        "第二个关键发现或洞察",
-        "第三个关键发现或洞察"
-    ],
-    "chart": {{
-        "type": "{chart_type}",
-        "title": "图表标题",
-        "data": {{
-            "categories": ["类别1", "类别2", "类别3"],
-            "series": {{
-                "系列名称1": [数值1, 数值2, 数值3],
-                "系列名称2": [数值1, 数值2, 数值3]
-            }}
-        }}
-    }}
-}}
-```
-
-注意：
-- text字段必须包含具体的分析内容，不能为空
-- bullet_points必须是3-5个要点的数组
-- 如果chart_type是"none"，则不需要chart字段
-- 如果需要图表，确保data中的categories数量与每个series的数值数量一致
-- 返回的必须是纯JSON，不要包含```json标记
-
-请确保内容与分析类型和数据相符，提供有价值的洞察。
-"""
+        page_prompt = _PAGE_PROMPT_TMPL({
+            "main_objective": main_objective,
+            "section_title": section_title,
+            "slide_title": subsection.get('subsection_title', ''),
+            "analysis_type": analysis_type,
+            "chart_type": chart_type,
+            "data_query": data_query,
+            "key_points": key_points,
+            "data_context": data_context,
+        })
         
         messages = [
             {"role": "system", "content": "你是一个数据分析和PPT内容生成专家。请根据要求生成准确、有洞察力的内容。重要：你必须返回纯JSON格式，不要包含任何额外的文字说明或markdown标记。"},
@@ -283,19 +423,20 @@ class DialogueService:
         
         try:
             # 允许工具调用来查询数据，由LLM客户端自动处理
-            response = self.llm_client.chat_completion(
+            response = await self.llm_client.achat_completion(
                 messages=messages,
                 tools=None,  # 让llm_client自动从tool_registry获取工具定义
                 tool_choice="auto",
                 temperature=0.5,
-                auto_execute_tools=True  # 启用自动工具调用
+                auto_execute_tools=True,  # 启用自动工具调用
+                tool_session=self.tool_session
             )
             
             # 获取最终响应内容
             content = response.choices[0].message.content
 
-            # 在解析JSON前，将占位符替换为真实数据
-            content = self.message_var_processor.resolve_placeholders_in_text(content)
+            # 在解析JSON前，将占位符替换为真实数据（JSON形式，不渲染HTML表格）
+            content = self.message_var_processor.resolve_placeholders_in_text(content, render="json")
             
             # 记录详细的LLM响应内容用于调试
             logger.info(f"LLM响应内容（前500字符）: {content[:500] if content else 'None'}")
@@ -304,40 +445,7 @@ class DialogueService:
             try:
                 llm_data = self._parse_llm_json_response(content, f"slide_content_{subsection.get('subsection_title', '')}")
                 
-                # 直接构建幻灯片数据结构
-                slide_data = {
-                    "type": "content",
-                    "title": subsection.get('subsection_title', ''),
-                    "contents": []
-                }
-                
-                # 添加文本内容
-                text_content = llm_data.get("text", "")
-                bullet_points = llm_data.get("bullet_points", [])
-                
-                # 确保bullet_points是列表
-                if isinstance(bullet_points, str):
-                    bullet_points = [bullet_points]
-                
-                # 如果有文本内容或要点，添加文本部分
-                if text_content or bullet_points:
-                    slide_data["contents"].append({
-                        "type": "text",
-                        "text": text_content,
-                        "bullet_points": bullet_points
-                    })
-                
-                # 添加图表内容
-                chart_info = llm_data.get("chart")
-                if chart_info and isinstance(chart_info, dict):
-                    chart_data = chart_info.get("data", {})
-                    if chart_data.get("categories") and chart_data.get("series"):
-                        slide_data["contents"].append({
-                            "type": "chart",
-                            "chart_type": chart_info.get("type", "column"),
-                            "chart_title": chart_info.get("title", ""),
-                            "data": chart_data
-                        })
+                slide_data = self._build_slide_data(subsection, llm_data)
                 
                 logger.info(f"成功生成幻灯片内容: {subsection.get('subsection_title', '')}, 包含 {len(slide_data['contents'])} 个内容块")
                 return slide_data
@@ -371,8 +479,100 @@ class DialogueService:
                     "bullet_points": []
                 }]
             }
+
+    async def _generate_slides_batch(self, section_title: str, subsections: List[Dict[str, Any]],
+                               data_context: str, main_objective: str) -> List[Dict[str, Any]]:
+        """
+        在一次LLM对话中为同一章节的多个幻灯片生成内容
+        
+        参数:
+            section_title: 章节标题
+            subsections: 子章节信息列表
+            data_context: 数据上下文
+            main_objective: 主要任务目标
+            
+        返回:
+            与subsections一一对应的幻灯片内容列表
+        """
+        if len(subsections) == 1:
+            return [await self._generate_slide_content(section_title, subsections[0], data_context, main_objective)]
+        
+        logger.info(f"开始批量生成幻灯片内容: {section_title}，共 {len(subsections)} 页")
+        pages = [
+            {
+                "index": i + 1,
+                "subsection_title": subsection.get("subsection_title", ""),
+                "analysis_type": subsection.get("analysis_type", "summary"),
+                "chart_type": subsection.get("chart_type", "none"),
+                "data_query": subsection.get("data_query", ""),
+                "key_points": subsection.get("key_points", [])
+            }
+            for i, subsection in enumerate(subsections)
+        ]
+        pages_json = orjson.dumps(pages).decode()
+        
+        # 构建批量页面生成prompt
+        batch_prompt = _BATCH_PROMPT_TMPL({
+            "main_objective": main_objective,
+            "section_title": section_title,
+            "pages_json": pages_json,
+            "data_context": data_context,
+        })
+        
+        messages = [
+            {"role": "system", "content": "你是一个数据分析和PPT内容生成专家。请根据要求生成准确、有洞察力的内容。重要：你必须返回纯JSON格式，不要包含任何额外的文字说明或markdown标记。"},
+            {"role": "user", "content": batch_prompt}
+        ]
+        
+        try:
+            response = await self.llm_client.achat_completion(
+                messages=messages,
+                tools=None,  # 让llm_client自动从tool_registry获取工具定义
+                tool_choice="auto",
+                temperature=0.5,
+                auto_execute_tools=True,
+                tool_session=self.tool_session
+            )
+            content = response.choices[0].message.content
+            content = self.message_var_processor.resolve_placeholders_in_text(content, render="json")
+            logger.info(f"批量LLM响应内容（前500字符）: {content[:500] if content else 'None'}")
+            
+            try:
+                llm_slides = self._parse_llm_json_response(content, f"slides_batch_{section_title}").get("slides")
+            except (ValueError, AttributeError) as e:
+                logger.warning(f"批量幻灯片内容解析失败，改为逐页生成: {e}")
+                llm_slides = None
+            if not isinstance(llm_slides, list):
+                llm_slides = []
+            
+        except Exception as e:
+            logger.error(f"批量生成幻灯片内容失败: {e}")
+            logger.error(traceback.format_exc())
+            return [
+                {
+                    "type": "content",
+                    "title": subsection.get('subsection_title', '错误页面'),
+                    "contents": [{
+                        "type": "text",
+                        "text": f"生成内容时出错: {str(e)}",
+                        "bullet_points": []
+                    }]
+                }
+                for subsection in subsections
+            ]
+        
+        slides = []
+        for i, subsection in enumerate(subsections):
+            llm_data = llm_slides[i] if i < len(llm_slides) else None
+            if isinstance(llm_data, dict):
+                slides.append(self._build_slide_data(subsection, llm_data))
+            else:
+                # 批量结果缺失该页时，单独为该页生成内容
+                slides.append(await self._generate_slide_content(section_title, subsection, data_context, main_objective))
+        logger.info(f"批量生成幻灯片内容完成: {section_title}")
+        return slides
     
-    async def generate_ppt_async(self, user_requirement: str, output_filename: str = "report") -> str:
+    async def generate_ppt_async(self, user_requirement: str, output_filename: str = "report") -> PPTResult:
         """
         异步生成PPT（支持并行生成内容）
         
@@ -381,18 +581,18 @@ class DialogueService:
             output_filename: 输出文件名
             
         返回:
-            生成结果消息
+            生成结果（消息文本及文件路径）
         """
         if not self.excel_orchestrator:
-            return "❌ 请先上传Excel文件"
+            return PPTResult("❌ 请先上传Excel文件")
         
         try:
             # 获取数据上下文
-            data_context = self.excel_orchestrator.get_llm_context()
+            data_context = self._cached_context
             
             print("📋 正在生成PPT大纲...")
             # 生成大纲
-            outline = self._generate_ppt_outline(user_requirement, data_context)
+            outline = await self._generate_ppt_outline(user_requirement, data_context)
             
             # 构建PPT结构
             ppt_data = {
@@ -406,53 +606,61 @@ class DialogueService:
                 "subtitle": f"生成时间：{datetime.now().strftime('%Y年%m月%d日')}"
             })
             
-            print(f"🚀 开始并行生成 {sum(len(s['subsections']) for s in outline['sections'])} 个内容页...")
-            
-            # 准备所有内容页生成任务（先并行生成所有内容）
-            loop = asyncio.get_event_loop()
-            futures = []
-            content_map = {}  # 用于存储内容页和其对应的位置
-            
-            for section_idx, section in enumerate(outline["sections"]):
-                for subsection_idx, subsection in enumerate(section.get("subsections", [])):
-                    # 创建唯一键来标识每个内容页的位置
-                    content_key = f"{section_idx}_{subsection_idx}"
-                    
-                    future = loop.run_in_executor(
-                        self.executor,
-                        self._generate_slide_content,
-                        section.get('section_title', ''),
-                        subsection,
+            # 将所有内容页展开为一个列表，计数、提交任务和组装都复用它：(章节下标, 子章节下标, 章节, 子章节)
+            sections = outline["sections"]
+            flat = [
+                (section_idx, subsection_idx, section, subsection)
+                for section_idx, section in enumerate(sections)
+                for subsection_idx, subsection in enumerate(section.get("subsections", []))
+            ]
+            
+            print(f"🚀 开始并行生成 {len(flat)} 个内容页...")
+            
+            # 准备所有内容页生成任务（同一章节的内容页按批合并为一次LLM对话，各批并发生成）
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_SLIDE_REQUESTS)
+            batch_indices = []  # 每批内容页在flat中的下标
+            batch_coros = []
+            content_results: List[Optional[Dict[str, Any]]] = [None] * len(flat)  # 与flat一一对应
+            
+            async def generate_batch(section_title: str, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    return await self._generate_slides_batch(
+                        section_title,
+                        batch,
                         data_context,
                         user_requirement  # 传递主要目标
                     )
-                    futures.append((content_key, future))
-            
-            # 等待所有内容页生成完成
-            content_results = []
-            for content_key, future in futures:
-                result = await future
-                content_results.append((content_key, result))
-            
-            # 将结果存储到map中
-            for content_key, result in content_results:
-                content_map[content_key] = result
-            
-            # 按正确的顺序组装PPT
-            for section_idx, section in enumerate(outline["sections"]):
-                # 添加章节页
-                section_slide = {
-                    "type": "section",
-                    "title": f"{section.get('section_number', '')} {section.get('section_title', '')}"
-                }
-                ppt_data["slides"].append(section_slide)
-                
-                # 添加该章节的所有内容页
-                for subsection_idx, subsection in enumerate(section.get("subsections", [])):
-                    content_key = f"{section_idx}_{subsection_idx}"
-                    if content_key in content_map:
-                        content_slide = content_map[content_key]
-                        ppt_data["slides"].append(content_slide)
+            
+            # 同一章节内的连续内容页按SLIDE_BATCH_SIZE分批
+            batch_start = 0
+            while batch_start < len(flat):
+                section_idx, _, section, _ = flat[batch_start]
+                batch_end = batch_start + 1
+                while batch_end < len(flat) and batch_end - batch_start < SLIDE_BATCH_SIZE and flat[batch_end][0] == section_idx:
+                    batch_end += 1
+                batch_indices.append(range(batch_start, batch_end))
+                batch_coros.append(generate_batch(section.get('section_title', ''), [flat[i][3] for i in range(batch_start, batch_end)]))
+                batch_start = batch_end
+            
+            # 等待所有内容页生成完成，并按下标写回结果
+            batch_results = await asyncio.gather(*batch_coros)
+            for indices, slides in zip(batch_indices, batch_results):
+                for i, slide in zip(indices, slides):
+                    content_results[i] = slide
+            
+            # 按正确的顺序组装PPT：每个章节为章节页+该章节的内容页（flat中同一章节的内容页是连续的），一次extend写入
+            section_ends = list(accumulate(len(section.get("subsections", [])) for section in sections))
+            section_starts = [0, *section_ends[:-1]]
+            ppt_data["slides"].extend(chain.from_iterable(
+                chain(
+                    ({
+                        "type": "section",
+                        "title": f"{section.get('section_number', '')} {section.get('section_title', '')}"
+                    },),
+                    (slide for slide in content_results[start:end] if slide is not None)
+                )
+                for section, start, end in zip(sections, section_starts, section_ends)
+            ))
 
             # 在末尾追加总结页（复用页面生成prompt，并把已生成的PPT数据摘要放入数据上下文）
             try:
@@ -466,7 +674,7 @@ class DialogueService:
                     "data_query": "",
                     "key_points": []
                 }
-                summary_slide = self._generate_slide_content(
+                summary_slide = await self._generate_slide_content(
                     "总结与展望",
                     summary_subsection,
                     summary_context,
@@ -479,15 +687,40 @@ class DialogueService:
             print("📝 正在创建PPT文件...")
             # 生成PPT文件
             output_file_path = path_manager.get_output_path(output_filename)
-            file_path = create_pptx_from_json(ppt_data, str(output_file_path))
+            # 生成PPTX是CPU密集的同步操作，放到线程中执行以免阻塞共享事件循环
+            file_path = await asyncio.to_thread(create_pptx_from_json, ppt_data, str(output_file_path))
             
-            return f"✅ PPT生成成功！\n文件路径：{file_path}\n总页数：{len(ppt_data['slides'])} 页"
+            return PPTResult(
+                f"✅ PPT生成成功！\n文件路径：{file_path}\n总页数：{len(ppt_data['slides'])} 页",
+                file_path
+            )
             
         except Exception as e:
             logger.error(f"PPT生成失败：{e}")
             logger.error(traceback.format_exc())
-            return f"❌ PPT生成失败：{str(e)}"
+            return PPTResult(f"❌ PPT生成失败：{str(e)}")
     
+    def generate_ppt(self, user_message: str) -> PPTResult:
+        """
+        根据用户需求生成PPT，返回结构化结果（调用方直接读取file_path，无需解析消息文本）
+        
+        参数:
+            user_message: 用户需求描述
+        """
+        self.conversation_history.append({
+            "role": "user",
+            "content": user_message
+        })
+        return self._run_generate_ppt(user_message)
+
+    def _run_generate_ppt(self, user_message: str) -> PPTResult:
+        # 同步调用异步方法：提交到常驻的后台事件循环（异步LLM客户端也绑定在这个循环上），避免每次调用都创建/关闭事件循环
+        future = asyncio.run_coroutine_threadsafe(
+            self.generate_ppt_async(user_message),
+            get_background_loop()
+        )
+        return future.result()
+
     def process_message(self, user_message: str, generate_ppt: bool = False) -> str:
         """
         处理用户消息
@@ -506,20 +739,7 @@ class DialogueService:
         })
         
         if generate_ppt:
-            # 同步调用异步方法 - 在FastAPI环境中正确处理
-            try:
-                # 检查是否已在事件循环中
-                asyncio.get_running_loop()
-                # 如果已在事件循环中，创建新的事件循环在线程中运行
-                loop = asyncio.new_event_loop()
-                try:
-                    result = loop.run_until_complete(self.generate_ppt_async(user_message))
-                finally:
-                    loop.close()
-            except RuntimeError:
-                # 没有运行的事件循环，可以直接使用asyncio.run
-                result = asyncio.run(self.generate_ppt_async(user_message))
-            return result
+            return self._run_generate_ppt(user_message).text
         else:
             # 普通对话模式，支持Excel分析
             try:
@@ -527,7 +747,8 @@ class DialogueService:
                     messages=self.conversation_history,
                     tools=None if self.excel_orchestrator else [],  # 有Excel时让llm_client自动获取工具，否则不使用工具
                     tool_choice="auto" if self.excel_orchestrator else None,
-                    auto_execute_tools=True  # 启用自动工具调用
+                    auto_execute_tools=True,  # 启用自动工具调用
+                    tool_session=self.tool_session
                 )
                 
                 # 获取最终响应内容
@@ -548,22 +769,26 @@ class DialogueService:
             except Exception as e:
                 return f"❌ 处理消息时出错：{str(e)}"
     
+    def close(self):
+        """释放会话占用的资源（DuckDB连接和数据表），会话被移除或过期时调用"""
+        orchestrator, self.excel_orchestrator = self.excel_orchestrator, None
+        self._cached_context = None
+        # 只清空本会话的工具上下文和结果缓存，其他会话不受影响
+        self.tool_session.set_context({})
+        if orchestrator is not None:
+            orchestrator.close()
+
     def clear_history(self):
-        """清空对话历史"""
-        self.conversation_history = []
+        """清空对话历史（保留全局系统提示）"""
+        self.conversation_history = list(_BASE_SYSTEM_MSGS)
         if self.excel_orchestrator:
             # 重新添加数据上下文
-            context = self.excel_orchestrator.get_llm_context()
+            context = self._cached_context
             self.conversation_history.append({
                 "role": "system",
                 "content": f"用户已上传Excel文件，数据上下文如下：\n{context}"
             })
 
-    def __del__(self):
-        """清理资源"""
-        if hasattr(self, 'executor') and self.executor:
-            self.executor.shutdown(wait=False)
-
 
 def main():
     """
@@ -1,10 +1,15 @@
 # llm_client.py
 import openai
-import json
+import httpx
+import asyncio
 import logging
+import orjson
 from typing import Dict, Any, Optional, List, Tuple
 import threading
 import os
+import time
+import hashlib
+import atexit
 import dotenv
 from datetime import datetime
 from tools.message_variable_processor import MessageVariableProcessor
@@ -14,25 +19,181 @@ dotenv.load_dotenv()
 # 设置日志
 logger = logging.getLogger(__name__)
 
+# 工具结果缓存的最大条目数
+TOOL_CACHE_MAX_ITEMS = 256
+
+# 异步LLM请求的并发上限与每分钟请求数上限（0表示不限速），可通过环境变量调整
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+
+
+def _build_http_client() -> httpx.Client:
+    """构建共享连接池的HTTP客户端：所有线程复用keep-alive连接（HTTP/2多路复用），避免每次请求重新握手"""
+    return httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+        timeout=httpx.Timeout(600.0, connect=10.0),
+    )
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    """构建异步HTTP客户端：放宽连接池上限，供并发生成幻灯片时大量请求复用keep-alive连接"""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+        timeout=httpx.Timeout(600.0, connect=10.0),
+    )
+
+
+# 进程内共享的后台事件循环：所有异步LLM请求都在这里执行，异步客户端及其连接池只绑定这一个事件循环
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """获取（必要时启动）在守护线程中常驻运行的后台事件循环"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="dialogue-service-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+
+class _AsyncRequestLimiter:
+    """
+    异步LLM请求限流器：限制同时进行中的请求数，并按每分钟请求数均匀放行，避免触发429
+    """
+    def __init__(self, max_concurrency: int, requests_per_minute: float = 0):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # 相邻两次请求的最小间隔（秒），0表示不限制速率
+        self._interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+    
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            now = asyncio.get_running_loop().time()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self._interval
+            if slot > now:
+                try:
+                    await asyncio.sleep(slot - now)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+class _FallbackResponse:
+    """模拟的响应对象，在无法获取最终LLM响应时返回给调用方"""
+    def __init__(self, content):
+        self.choices = [_FallbackChoice(content)]
+
+
+class _FallbackChoice:
+    def __init__(self, content):
+        self.message = _FallbackMessage(content)
+
+
+class _FallbackMessage:
+    def __init__(self, content):
+        self.content = content
+        self.tool_calls = None
+
+
+class ToolSession:
+    """
+    单个对话会话的工具执行状态：工具注册器、工具执行上下文（如excel_orchestrator）、
+    消息变量处理器及工具结果缓存。每个会话各自持有一份，调用时传给chat_completion/achat_completion，
+    多个会话在不同线程中并发对话时互不影响。
+    """
+    def __init__(self, tool_registry=None, context: Optional[Dict[str, Any]] = None,
+                 message_var_processor: Optional[MessageVariableProcessor] = None):
+        self.tool_registry = tool_registry
+        self.context: Dict[str, Any] = context if context is not None else {}
+        self.message_var_processor = message_var_processor or MessageVariableProcessor()
+        # 工具结果缓存：{ hash(工具名|参数): (写入时间, 原始结果字符串) }，上下文变化时清空
+        self.tool_cache: Dict[str, Tuple[float, str]] = {}
+        # 同一会话的多个工具调用在不同线程中并发执行，写缓存时加锁
+        self._cache_lock = threading.Lock()
+        # 登记已知工具名到变量处理器，提升占位符识别精准度
+        if tool_registry is not None:
+            for name in tool_registry.list_tools():
+                self.message_var_processor.register_known_tool(name)
+    
+    def set_context(self, context: Dict[str, Any]):
+        """设置工具执行上下文（上下文变化后缓存的工具结果不再有效）"""
+        self.context = context
+        self.tool_cache = {}
+    
+    def update_context(self, updates: Dict[str, Any]):
+        """更新工具执行上下文；生成新的dict替换，不修改其他线程正在读取的旧上下文"""
+        self.set_context({**self.context, **updates})
+    
+    def get_cached_result(self, cache_key: str, cache_ttl: float) -> Optional[str]:
+        """获取缓存有效期内的工具结果，没有则返回None"""
+        cached = self.tool_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < cache_ttl:
+            return cached[1]
+        return None
+    
+    def store_result(self, cache_key: str, result_str: str):
+        """写入工具结果缓存，超出上限时淘汰最早写入的条目"""
+        with self._cache_lock:
+            tool_cache = self.tool_cache
+            tool_cache.pop(cache_key, None)
+            tool_cache[cache_key] = (time.monotonic(), result_str)
+            while len(tool_cache) > TOOL_CACHE_MAX_ITEMS:
+                tool_cache.pop(next(iter(tool_cache)))
+
+
 class OpenAIConnector:
     _instance = None
     _lock = threading.Lock()
     
     def __new__(cls, api_key: Optional[str] = None, **kwargs):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance._initialize(api_key, **kwargs)
-        return cls._instance
+        # 快速路径：实例已存在时直接返回，不获取锁
+        instance = cls._instance
+        if instance is not None:
+            return instance
+        with cls._lock:
+            instance = cls._instance
+            if instance is None:
+                instance = super().__new__(cls)
+                instance._initialize(api_key, **kwargs)
+                # 初始化完成后再发布，其他线程不会拿到未初始化完的实例
+                cls._instance = instance
+        return instance
     
     def _initialize(self, api_key: Optional[str], **kwargs):
         """初始化 OpenAI 客户端"""
         # 首先初始化所有必要的属性
-        self.tool_registry = None
-        self.tool_context = {}
-        self.message_var_processor = MessageVariableProcessor()
+        # 调用方未传入tool_session时使用的默认工具状态
+        self.default_tool_session = ToolSession()
         self.llm_logs: List[Dict[str, Any]] = []
+        # 工具定义缓存（首次使用时从pptx_json.json加载）
+        self._tools_cache: Optional[List[Dict[str, Any]]] = None
+        # LLM交互日志文件句柄：进程内只打开一次，无缓冲二进制模式下每条日志一次写入，日志接口能读到最新记录
+        self._log_lock = threading.Lock()
+        self._log_file = None
+        try:
+            self._log_file = open(path_manager.get_log_path('llm_interactions.log'), 'ab', buffering=0)
+            atexit.register(self._close_log_file)
+        except Exception as e:
+            logger.warning(f"打开LLM交互日志文件失败: {e}")
+        # 所有同步请求共享同一个连接池，重新初始化客户端时也继续复用
+        self.http_client = kwargs.pop("http_client", None) or _build_http_client()
+        # 异步客户端在后台事件循环中首次使用时创建（其连接池绑定在该事件循环上）
+        self.async_client: Optional[openai.AsyncOpenAI] = None
+        # 异步请求限流器，与异步客户端一同创建
+        self._async_limiter: Optional[_AsyncRequestLimiter] = None
+        # 每个异步客户端上进行中的请求数（只在后台事件循环中读写），被替换的客户端在计数归零后关闭
+        self._async_inflight: Dict[openai.AsyncOpenAI, int] = {}
         
         # 尝试获取API密钥，优先级：参数 > 环境变量
         api_key = api_key or os.getenv("OPENAI_API_KEY")
@@ -40,7 +201,12 @@ class OpenAIConnector:
         
         # 如果有API密钥，初始化OpenAI客户端
         if api_key:
-            self.client = openai.OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL"), **kwargs)
+            self.client = openai.OpenAI(
+                api_key=api_key,
+                base_url=os.getenv("OPENAI_BASE_URL"),
+                http_client=self.http_client,
+                **kwargs
+            )
         else:
             # 没有API密钥时，client为None，在使用时会提示用户配置
             self.client = None
@@ -49,7 +215,8 @@ class OpenAIConnector:
     @classmethod
     def get_instance(cls) -> 'OpenAIConnector':
         """获取单例实例"""
-        if cls._instance is None:
+        instance = cls._instance
+        if instance is None:
             # 尝试使用环境变量中的API密钥初始化
             if os.getenv("OPENAI_API_KEY"):
                 return cls()
@@ -57,7 +224,7 @@ class OpenAIConnector:
                 "OpenAIConnector has not been initialized yet and no OPENAI_API_KEY environment variable found. "
                 "Please initialize with an API key first."
             )
-        return cls._instance
+        return instance
     
     def chat_completion(
         self,
@@ -67,6 +234,7 @@ class OpenAIConnector:
         tool_choice: Optional[str] = None,
         auto_execute_tools: bool = True,
         max_tool_rounds: int = 10,
+        tool_session: Optional[ToolSession] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -79,6 +247,7 @@ class OpenAIConnector:
             tool_choice: 工具选择策略
             auto_execute_tools: 是否自动执行工具调用
             max_tool_rounds: 最大工具调用轮数
+            tool_session: 本次对话所属会话的工具状态，未提供时使用default_tool_session
             **kwargs: 其他OpenAI参数
             
         返回:
@@ -89,9 +258,10 @@ class OpenAIConnector:
             raise ValueError("未配置OpenAI API密钥，请在设置中配置API密钥")
         
         model = model or self.default_model
+        tool_session = tool_session or self.default_tool_session
         
         # 如果没有提供tools，尝试从tool_registry获取
-        if tools is None and self.tool_registry:
+        if tools is None and tool_session.tool_registry:
             tools = self._get_tools_from_registry()
         tools = tools or []
         
@@ -109,7 +279,7 @@ class OpenAIConnector:
             
             # 启用自动工具调用
             return self._handle_chat_with_tools(
-                messages, model, tools, tool_choice, max_tool_rounds, **kwargs
+                messages, model, tools, tool_choice, max_tool_rounds, tool_session, **kwargs
             )
             
         except Exception as e:
@@ -122,6 +292,7 @@ class OpenAIConnector:
         tools: List[Dict[str, Any]], 
         tool_choice: Optional[str],
         max_tool_rounds: int,
+        tool_session: ToolSession,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -133,12 +304,14 @@ class OpenAIConnector:
             tools: 可用工具列表
             tool_choice: 工具选择策略
             max_tool_rounds: 最大工具调用轮数
+            tool_session: 本次对话所属会话的工具状态
             **kwargs: 其他OpenAI参数
             
         返回:
             最终的LLM响应
         """
-        current_messages = messages.copy()
+        # 复制一份消息列表，后续轮次只在其末尾追加，不修改调用方的列表
+        current_messages = list(messages)
         current_round = 0
         
         while current_round < max_tool_rounds:
@@ -163,42 +336,14 @@ class OpenAIConnector:
             if not message.tool_calls:
                 return response
             
-            # 添加包含tool_calls的assistant消息
-            current_messages.append({
-                "role": "assistant",
-                "content": None,  # tool_calls消息的content必须是None
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    } for tc in message.tool_calls
-                ]
-            })
-            
-            # 执行每个工具调用并添加对应的tool消息
+            # 依次执行每个工具调用，连同assistant消息一次性追加到对话中
+            tool_results = []
             for tool_call in message.tool_calls:
                 try:
-                    tool_name, result = self._execute_tool_call(tool_call)
-                    logger.debug(f"工具 {tool_name} 执行完成，结果长度: {len(result)}")
-                    
-                    # 添加tool响应消息
-                    current_messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": result
-                    })
+                    tool_results.append(self._execute_tool_call(tool_call, tool_session))
                 except Exception as e:
-                    logger.error(f"工具调用失败: {e}")
-                    # 即使失败也要添加tool消息，否则会导致格式错误
-                    current_messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps({"error": str(e)}, ensure_ascii=False)
-                    })
+                    tool_results.append(e)
+            current_messages.extend(self._build_tool_round_messages(message.tool_calls, tool_results))
             
             current_round += 1
         
@@ -222,54 +367,253 @@ class OpenAIConnector:
             
         except Exception as e:
             logger.error(f"获取最终LLM响应失败: {e}")
-            # 创建一个模拟的响应对象
-            class MockResponse:
-                def __init__(self, content):
-                    self.choices = [MockChoice(content)]
+            # 返回一个模拟的响应对象
+            return _FallbackResponse(f"达到最大工具调用轮数，且获取最终响应时出错: {str(e)}")
+    
+    def _get_async_client(self) -> openai.AsyncOpenAI:
+        """获取异步OpenAI客户端（只在后台事件循环中调用，首次使用时创建）"""
+        if self.async_client is None:
+            self.async_client = openai.AsyncOpenAI(
+                api_key=self.client.api_key,
+                base_url=self.client.base_url,
+                http_client=_build_async_http_client()
+            )
+            self._async_limiter = _AsyncRequestLimiter(OPENAI_MAX_CONCURRENCY, OPENAI_REQUESTS_PER_MINUTE)
+        return self.async_client
+    
+    async def _acreate_completion(self, **kwargs):
+        """经限流器发起一次异步chat completion请求，所有对话共享并发与速率额度"""
+        loop = get_background_loop()
+        if asyncio.get_running_loop() is not loop:
+            # 异步客户端只绑定后台事件循环，其他事件循环中的调用转交给后台事件循环执行，不为每个事件循环另建连接池
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._acreate_completion(**kwargs), loop))
+        client = self._get_async_client()
+        self._async_inflight[client] = self._async_inflight.get(client, 0) + 1
+        try:
+            async with self._async_limiter:
+                return await client.chat.completions.create(**kwargs)
+        finally:
+            remaining = self._async_inflight.pop(client) - 1
+            if remaining:
+                self._async_inflight[client] = remaining
+            elif client is not self.async_client:
+                # 客户端已被reinitialize_client替换，最后一个进行中的请求结束后关闭其连接池
+                await client.close()
+    
+    def _retire_async_client(self):
+        """丢弃当前异步客户端（在后台事件循环中执行），下次使用时按新配置创建；旧客户端没有进行中的请求时立即关闭"""
+        old_async_client, self.async_client = self.async_client, None
+        if old_async_client is not None and old_async_client not in self._async_inflight:
+            asyncio.get_running_loop().create_task(old_async_client.close())
+    
+    async def achat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        auto_execute_tools: bool = True,
+        max_tool_rounds: int = 10,
+        tool_session: Optional[ToolSession] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        chat_completion的异步版本，多个对话可在同一事件循环中并发进行
+        
+        参数与返回值同chat_completion
+        """
+        # 检查是否已配置API密钥
+        if not self.client:
+            raise ValueError("未配置OpenAI API密钥，请在设置中配置API密钥")
+        
+        model = model or self.default_model
+        tool_session = tool_session or self.default_tool_session
+        
+        # 如果没有提供tools，尝试从tool_registry获取
+        if tools is None and tool_session.tool_registry:
+            tools = self._get_tools_from_registry()
+        tools = tools or []
+        
+        try:
+            # 如果不支持工具调用或没有工具，直接调用
+            if not auto_execute_tools or not tools:
+                return await self._acreate_completion(
+                    model=model,
+                    messages=messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    **kwargs
+                )
             
-            class MockChoice:
-                def __init__(self, content):
-                    self.message = MockMessage(content)
+            # 启用自动工具调用
+            return await self._ahandle_chat_with_tools(
+                messages, model, tools, tool_choice, max_tool_rounds, tool_session, **kwargs
+            )
             
-            class MockMessage:
-                def __init__(self, content):
-                    self.content = content
-                    self.tool_calls = None
+        except Exception as e:
+            raise RuntimeError(f"Failed to get chat completion: {str(e)}")
+    
+    async def _ahandle_chat_with_tools(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: str, 
+        tools: List[Dict[str, Any]], 
+        tool_choice: Optional[str],
+        max_tool_rounds: int,
+        tool_session: ToolSession,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        _handle_chat_with_tools的异步版本，同一轮的多个工具调用在线程中并发执行
+        """
+        # 复制一份消息列表，后续轮次只在其末尾追加，不修改调用方的列表
+        current_messages = list(messages)
+        current_round = 0
+        
+        while current_round < max_tool_rounds:
+            # 记录LLM请求
+            self._log_llm_interaction(f"chat_round_{current_round}", current_messages, None)
+            
+            # 调用LLM
+            response = await self._acreate_completion(
+                model=model,
+                messages=current_messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                **kwargs
+            )
+            
+            message = response.choices[0].message
             
-            return MockResponse(f"达到最大工具调用轮数，且获取最终响应时出错: {str(e)}")
+            # 记录LLM响应
+            self._log_llm_interaction(f"chat_round_{current_round}", None, message.content)
+            
+            # 如果没有工具调用，返回最终结果
+            if not message.tool_calls:
+                return response
+            
+            # 并发执行本轮所有工具调用，再按原顺序连同assistant消息一次性追加到对话中
+            tool_results = await asyncio.gather(
+                *(self._aexecute_tool_call(tool_call, tool_session) for tool_call in message.tool_calls),
+                return_exceptions=True
+            )
+            current_messages.extend(self._build_tool_round_messages(message.tool_calls, tool_results))
+            
+            current_round += 1
+        
+        # 达到最大轮数，强制要求LLM给出最终答案
+        current_messages.append({
+            "role": "user",
+            "content": "请基于以上工具调用的结果，直接给出最终答案，不要再调用任何工具。"
+        })
+        
+        try:
+            final_response = await self._acreate_completion(
+                model=model,
+                messages=current_messages,
+                tools=None,  # 禁用工具调用
+                tool_choice=None,
+                **kwargs
+            )
+            
+            logger.warning(f"达到最大工具调用轮数 {max_tool_rounds}，已获取最终答案")
+            return final_response
+            
+        except Exception as e:
+            logger.error(f"获取最终LLM响应失败: {e}")
+            return _FallbackResponse(f"达到最大工具调用轮数，且获取最终响应时出错: {str(e)}")
     
-    def _execute_tool_call(self, tool_call) -> Tuple[str, str]:
+    def _build_tool_round_messages(self, tool_calls, tool_results: List[Any]) -> List[Dict[str, Any]]:
+        """
+        构建一轮工具调用需要追加的消息：包含tool_calls的assistant消息，及按顺序对应的tool消息
+        
+        参数:
+            tool_calls: LLM返回的tool_call列表
+            tool_results: 与tool_calls一一对应的(工具名称, 执行结果)或异常
+            
+        返回:
+            待追加的消息列表
+        """
+        round_messages: List[Dict[str, Any]] = [{
+            "role": "assistant",
+            "content": None,  # tool_calls消息的content必须是None
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": "function",
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                } for tc in tool_calls
+            ]
+        }]
+        for tool_call, outcome in zip(tool_calls, tool_results):
+            if isinstance(outcome, Exception):
+                logger.error(f"工具调用失败: {outcome}")
+                # 即使失败也要添加tool消息，否则会导致格式错误
+                content = orjson.dumps({"error": str(outcome)}).decode()
+            else:
+                tool_name, content = outcome
+                logger.debug(f"工具 {tool_name} 执行完成，结果长度: {len(content)}")
+            round_messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": content
+            })
+        return round_messages
+    
+    async def _aexecute_tool_call(self, tool_call, tool_session: ToolSession) -> Tuple[str, str]:
+        """在线程中执行工具调用（工具均为同步实现），不阻塞事件循环"""
+        return await asyncio.to_thread(self._execute_tool_call, tool_call, tool_session)
+    
+    def _execute_tool_call(self, tool_call, tool_session: ToolSession) -> Tuple[str, str]:
         """
         执行工具调用
         
         参数:
             tool_call: OpenAI返回的tool_call对象
+            tool_session: 所属会话的工具状态（提供工具注册器、工具上下文、变量处理器和结果缓存）
             
         返回:
             (工具名称, 执行结果)
         """
-        if not self.tool_registry:
-            return tool_call.function.name, json.dumps({
+        tool_registry = tool_session.tool_registry
+        if not tool_registry:
+            return tool_call.function.name, orjson.dumps({
                 "error": "工具注册器未初始化"
-            }, ensure_ascii=False)
+            }).decode()
         
         function_name = tool_call.function.name
-        function_args = json.loads(tool_call.function.arguments)
         
-        # 使用工具注册器执行工具
-        tool_name, result_str = self.tool_registry.execute_tool(function_name, function_args, self.tool_context)
+        # 相同工具+参数在缓存有效期内直接复用上次的结果
+        cache_ttl = tool_registry.get_cache_ttl(function_name)
+        cache_key = hashlib.blake2b(f"{function_name}|{tool_call.function.arguments}".encode("utf-8")).hexdigest()
+        cached = tool_session.get_cached_result(cache_key, cache_ttl) if cache_ttl > 0 else None
+        if cached is not None:
+            logger.debug(f"工具 {function_name} 命中结果缓存")
+            tool_name, result_str = function_name, cached
+        else:
+            function_args = orjson.loads(tool_call.function.arguments)
+            # 使用工具注册器执行工具（上下文来自本次对话所属的会话）
+            tool_name, result_str = tool_registry.execute_tool(function_name, function_args, tool_session.context)
 
         # 将结果注册为变量绑定，并返回轻量payload供LLM消费
         try:
             # 尝试解析为JSON对象，失败则按原字符串存储
             parsed: Any
             try:
-                parsed = json.loads(result_str)
-            except Exception:
+                parsed = orjson.loads(result_str)
+            except orjson.JSONDecodeError:
                 parsed = result_str
+            
+            # 仅缓存成功的结果
+            if cache_ttl > 0 and cached is None and not (isinstance(parsed, dict) and "error" in parsed):
+                tool_session.store_result(cache_key, result_str)
 
-            var_name = self.message_var_processor.register_binding(tool_name, parsed)
-            lightweight = self.message_var_processor.build_lightweight_tool_payload(
+            message_var_processor = tool_session.message_var_processor
+            var_name = message_var_processor.register_binding(tool_name, parsed)
+            lightweight = message_var_processor.build_lightweight_tool_payload(
                 tool_name=tool_name,
                 var_name=var_name,
                 original_value=parsed,
@@ -282,20 +626,21 @@ class OpenAIConnector:
     
     def _get_tools_from_registry(self) -> List[Dict[str, Any]]:
         """
-        从tool_registry获取工具定义列表
+        获取工具定义列表（调用方已确认会话设置了tool_registry）
         
         返回:
-            工具定义列表，如果没有tool_registry则返回空列表
+            工具定义列表，加载失败时返回空列表
         """
-        if not self.tool_registry:
-            return []
+        # 工具定义文件在进程运行期间不变，只加载一次
+        if self._tools_cache is not None:
+            return self._tools_cache
         
         # 尝试加载工具定义文件
         try:
             tools_file_path = path_manager.get_resource_path('tools/pptx_json.json')
             if tools_file_path.exists():
-                with open(tools_file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                self._tools_cache = orjson.loads(tools_file_path.read_bytes())
+                return self._tools_cache
             else:
                 logger.warning(f"工具定义文件不存在: {tools_file_path}")
                 return []
@@ -328,28 +673,52 @@ class OpenAIConnector:
             "response": response
         })
         
-        # 写入简化的文件日志
+        # 写入简化的文件日志（复用常驻文件句柄，多线程写入时加锁保证每行完整）
+        if self._log_file is None:
+            return
         try:
-            log_file_path = path_manager.get_log_path('llm_interactions.log')
-            with open(log_file_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+            line = orjson.dumps(log_entry, option=orjson.OPT_APPEND_NEWLINE)
+            with self._log_lock:
+                self._log_file.write(line)
         except Exception as e:
             logger.warning(f"写入LLM交互日志失败: {e}")
     
+    def _close_log_file(self):
+        """进程退出时刷新并关闭LLM交互日志文件"""
+        with self._log_lock:
+            if self._log_file is not None:
+                try:
+                    self._log_file.close()
+                except Exception:
+                    pass
+                self._log_file = None
+    
     def set_default_model(self, model: str):
         """设置默认模型"""
         self.default_model = model
     
+    @property
+    def tool_registry(self):
+        """默认工具状态的工具注册器"""
+        return self.default_tool_session.tool_registry
+    
+    @property
+    def message_var_processor(self) -> MessageVariableProcessor:
+        """默认工具状态的消息变量处理器"""
+        return self.default_tool_session.message_var_processor
+    
     def set_tool_registry(self, tool_registry):
-        """设置工具注册器"""
-        self.tool_registry = tool_registry
+        """设置默认工具状态的工具注册器"""
+        self.default_tool_session.tool_registry = tool_registry
     
     def reinitialize_client(self):
         """重新初始化OpenAI客户端（用于配置更新后）"""
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key:
             base_url = os.getenv("OPENAI_BASE_URL")
-            self.client = openai.OpenAI(api_key=api_key, base_url=base_url)
+            self.client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client)
+            # 在后台事件循环中替换异步客户端：进行中的请求继续使用旧客户端，全部结束后再关闭它
+            get_background_loop().call_soon_threadsafe(self._retire_async_client)
             self.default_model = os.getenv("OPENAI_MODEL", "gpt-4.1")
             logger.info("OpenAI客户端已重新初始化")
         else:
@@ -362,12 +731,12 @@ class OpenAIConnector:
             pass
     
     def set_tool_context(self, context: Dict[str, Any]):
-        """设置工具执行上下文"""
-        self.tool_context = context
+        """设置默认工具状态的执行上下文（上下文变化后缓存的工具结果不再有效）"""
+        self.default_tool_session.set_context(context)
     
     def update_tool_context(self, updates: Dict[str, Any]):
-        """更新工具执行上下文"""
-        self.tool_context.update(updates)
+        """更新默认工具状态的执行上下文（上下文变化后缓存的工具结果不再有效）"""
+        self.default_tool_session.update_context(updates)
 
 # 创建全局实例（不自动初始化）
 global_openai_connector: Optional[OpenAIConnector] = None
@@ -10,6 +10,8 @@ class PathManager:
     """
     路径管理器，用于获取不同环境下的正确资源路径。
     """
+    __slots__ = ('resource_base_path', 'writable_base_path', '_output_dir', '_log_dir', '_temp_dir', '_created_dirs')
+
     def __init__(self):
         """
         初始化路径管理器，确定应用根目录。
@@ -38,6 +40,18 @@ class PathManager:
             self.resource_base_path = project_root
             self.writable_base_path = project_root
 
+        # 可写子目录只计算一次路径，首次使用时创建
+        self._output_dir = self.writable_base_path / "output"
+        self._log_dir = self.writable_base_path / "log"
+        self._temp_dir = self.writable_base_path / "temp"
+        self._created_dirs = set()
+
+    def _ensure_dir(self, directory: Path) -> Path:
+        """确保目录存在（每个目录在进程内只创建一次）"""
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory)
+        return directory
 
     def get_resource_path(self, relative_path: str) -> Path:
         """
@@ -52,6 +66,15 @@ class PathManager:
         """
         return self.resource_base_path / relative_path
 
+    def get_output_dir(self) -> Path:
+        """
+        获取输出目录，并确保目录存在。
+
+        返回:
+            输出目录的绝对路径。
+        """
+        return self._ensure_dir(self._output_dir)
+
     def get_output_path(self, filename: str) -> Path:
         """
         获取输出文件的路径，并确保目录存在。
@@ -62,9 +85,7 @@ class PathManager:
         返回:
             输出文件的绝对路径。
         """
-        output_dir = self.writable_base_path / "output"
-        output_dir.mkdir(parents=True, exist_ok=True)
-        return output_dir / filename
+        return self._ensure_dir(self._output_dir) / filename
 
     def get_log_path(self, filename: str) -> Path:
         """
@@ -76,9 +97,7 @@ class PathManager:
         返回:
             日志文件的绝对路径。
         """
-        log_dir = self.writable_base_path / "log"
-        log_dir.mkdir(parents=True, exist_ok=True)
-        return log_dir / filename
+        return self._ensure_dir(self._log_dir) / filename
 
     def get_temp_path(self, filename: str) -> Path:
         """
@@ -90,9 +109,7 @@ class PathManager:
         返回:
             临时文件的绝对路径。
         """
-        temp_dir = self.writable_base_path / "temp"
-        temp_dir.mkdir(parents=True, exist_ok=True)
-        return temp_dir / filename
+        return self._ensure_dir(self._temp_dir) / filename
 
 # 创建一个全局实例供项目其他模块使用
 path_manager = PathManager()
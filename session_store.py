@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+会话存储 - 分片加锁的键值存储，按最后访问时间做TTL回收
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 分片数量（必须是2的幂，用位与代替取模选择分片）
+SHARD_COUNT = 16
+
+
+class SessionStore:
+    """
+    分片存储：每个分片是一个独立的dict并由自己的锁保护，按key的哈希选择分片，
+    不同分片上的读写互不竞争。每个条目记录最后访问时间，超过TTL未访问的条目由evict_expired回收；
+    通过acquire固定的条目在release之前不会被回收。
+    """
+
+    def __init__(self, ttl_seconds: float, on_evict: Optional[Callable[[Any], None]] = None,
+                 shard_count: int = SHARD_COUNT):
+        """
+        参数:
+            ttl_seconds: 条目闲置多久后被回收（秒）
+            on_evict: 条目因过期被回收时调用的清理函数，参数为条目的值
+            shard_count: 分片数量，必须是2的幂
+        """
+        if shard_count <= 0 or shard_count & (shard_count - 1):
+            raise ValueError("shard_count必须是2的幂")
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        self._mask = shard_count - 1
+        # 每个分片：{ key: (value, last_seen) }
+        self._shards: List[Dict[str, Tuple[Any, float]]] = [{} for _ in range(shard_count)]
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shard_count)]
+        # 每个分片：{ key: 固定次数 }，只记录正在被使用的条目
+        self._pins: List[Dict[str, int]] = [{} for _ in range(shard_count)]
+
+    def _index(self, key: str) -> int:
+        return hash(key) & self._mask
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取条目并刷新其最后访问时间"""
+        i = self._index(key)
+        with self._locks[i]:
+            entry = self._shards[i].get(key)
+            if entry is None:
+                return default
+            self._shards[i][key] = (entry[0], time.monotonic())
+            return entry[0]
+
+    def acquire(self, key: str, default: Any = None) -> Any:
+        """获取条目并固定它，固定期间不会被evict_expired回收。取到条目时须与release成对调用"""
+        i = self._index(key)
+        with self._locks[i]:
+            entry = self._shards[i].get(key)
+            if entry is None:
+                return default
+            self._shards[i][key] = (entry[0], time.monotonic())
+            pins = self._pins[i]
+            pins[key] = pins.get(key, 0) + 1
+            return entry[0]
+
+    def release(self, key: str) -> None:
+        """解除一次acquire的固定，并刷新最后访问时间（TTL从使用结束时重新计算）"""
+        i = self._index(key)
+        with self._locks[i]:
+            pins = self._pins[i]
+            count = pins.get(key, 0) - 1
+            if count > 0:
+                pins[key] = count
+            else:
+                pins.pop(key, None)
+            entry = self._shards[i].get(key)
+            if entry is not None:
+                self._shards[i][key] = (entry[0], time.monotonic())
+
+    def set(self, key: str, value: Any) -> None:
+        i = self._index(key)
+        with self._locks[i]:
+            self._shards[i][key] = (value, time.monotonic())
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """移除条目并返回其值（不调用on_evict，由调用方自行清理）"""
+        i = self._index(key)
+        with self._locks[i]:
+            entry = self._shards[i].pop(key, None)
+        return default if entry is None else entry[0]
+
+    def __contains__(self, key: str) -> bool:
+        i = self._index(key)
+        with self._locks[i]:
+            return key in self._shards[i]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def values(self) -> List[Any]:
+        """所有条目值的快照（不刷新访问时间）"""
+        result = []
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                result.extend(value for value, _ in shard.values())
+        return result
+
+    def evict_expired(self) -> int:
+        """回收所有超过TTL未访问且未被固定的条目，返回回收数量。清理函数在锁外调用"""
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = []
+        for lock, shard, pins in zip(self._locks, self._shards, self._pins):
+            with lock:
+                stale_keys = [key for key, (_, last_seen) in shard.items()
+                              if last_seen < deadline and key not in pins]
+                for key in stale_keys:
+                    expired.append((key, shard.pop(key)[0]))
+
+        for key, value in expired:
+            logger.info(f"条目闲置超时被回收: {key}")
+            if self._on_evict is not None:
+                try:
+                    self._on_evict(value)
+                except Exception as e:
+                    logger.warning(f"回收条目 {key} 时清理失败: {e}")
+        return len(expired)
+
+    async def run_janitor(self, interval_seconds: float = 60) -> None:
+        """后台清理协程：每隔interval_seconds回收一次过期条目，直到被取消"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            # 清理函数可能关闭数据库连接等，放到线程中执行，不阻塞事件循环
+            await asyncio.to_thread(self.evict_expired)
@@ -312,8 +312,8 @@ async function generatePPT() {
             currentTaskId = result.task_id;
             addMessage('system', '✅ PPT生成任务已启动，正在处理...');
             
-            // 开始轮询任务状态
-            pollTaskStatus();
+            // 开始接收任务状态（WebSocket推送，失败时轮询）
+            watchTaskStatus();
         } else {
             throw new Error(result.detail || 'PPT生成启动失败');
         }
@@ -341,6 +341,51 @@ function updateProgress(percent, message) {
     document.getElementById('progress-text').textContent = message;
 }
 
+// 处理一次任务状态更新，任务结束时返回true
+function handleTaskStatus(status) {
+    updateProgress(status.progress, status.message);
+    
+    if (status.status === 'completed') {
+        addMessage('system', '✅ ' + status.message);
+        hidePPTProgress();
+        refreshOutputFiles();
+        return true;
+    } else if (status.status === 'failed') {
+        addMessage('system', '❌ ' + status.message);
+        hidePPTProgress();
+        return true;
+    }
+    return false;
+}
+
+// 优先通过WebSocket接收任务状态推送，连接失败时退回轮询
+function watchTaskStatus() {
+    if (!currentTaskId) return;
+    if (!('WebSocket' in window)) {
+        pollTaskStatus();
+        return;
+    }
+    
+    const taskId = currentTaskId;
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/ws/task-status/${taskId}`);
+    let finished = false;
+    
+    socket.onmessage = (event) => {
+        if (currentTaskId !== taskId) {
+            socket.close();
+            return;
+        }
+        finished = handleTaskStatus(JSON.parse(event.data));
+    };
+    socket.onclose = () => {
+        // 连接在任务结束前断开（代理不支持WebSocket、网络中断等），改为轮询
+        if (!finished && currentTaskId === taskId) {
+            pollTaskStatus();
+        }
+    };
+}
+
 async function pollTaskStatus() {
     if (!currentTaskId) return;
     
@@ -348,16 +393,7 @@ async function pollTaskStatus() {
         const response = await fetch(`/api/task-status/${currentTaskId}`);
         const status = await response.json();
         
-        updateProgress(status.progress, status.message);
-        
-        if (status.status === 'completed') {
-            addMessage('system', '✅ ' + status.message);
-            hidePPTProgress();
-            refreshOutputFiles();
-        } else if (status.status === 'failed') {
-            addMessage('system', '❌ ' + status.message);
-            hidePPTProgress();
-        } else {
+        if (!handleTaskStatus(status)) {
             // 继续轮询
             setTimeout(pollTaskStatus, 2000);
         }
@@ -1,12 +1,18 @@
-import json
+import gc
+import io
 import os
+import re
+from functools import lru_cache
 from typing import Dict, List, Union, Any, Tuple
 from pathlib import Path
+import orjson
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN
 from pptx.enum.chart import XL_CHART_TYPE
 from pptx.chart.data import CategoryChartData
+from pptx.oxml.ns import qn
+from lxml import etree
 import logging
 from .tool_registry import ToolHandler
 from path_manager import path_manager
@@ -15,8 +21,46 @@ from path_manager import path_manager
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-
-
+# 图表类型映射（JSON中的chart_type -> python-pptx图表类型）
+_CHART_TYPE_MAP = {
+    "column": XL_CHART_TYPE.COLUMN_CLUSTERED, 
+    "bar": XL_CHART_TYPE.BAR_CLUSTERED,
+    "line": XL_CHART_TYPE.LINE_MARKERS,
+    "pie": XL_CHART_TYPE.PIE, 
+    "area": XL_CHART_TYPE.AREA_STACKED
+}
+_DEFAULT_CHART_TYPE = XL_CHART_TYPE.COLUMN_CLUSTERED
+
+# 常用对齐方式
+_ALIGN_CENTER = PP_ALIGN.CENTER
+_ALIGN_LEFT = PP_ALIGN.LEFT
+
+# 表格单元格OXML标签及左对齐属性值
+_A_P = qn("a:p")
+_A_PPR = qn("a:pPr")
+_A_R = qn("a:r")
+_A_T = qn("a:t")
+_A_TXBODY = qn("a:txBody")
+_ALGN_LEFT = "l"
+
+# 含换行/控制字符的单元格文本需要交给python-pptx处理（拆分段落、转义非法XML字符）
+_CELL_TEXT_NEEDS_API_RE = re.compile(r"[\x00-\x08\x0a-\x1f]")
+
+# 默认模板中的幻灯片版式下标
+_LAYOUT_TITLE = 0      # 标题幻灯片
+_LAYOUT_SECTION = 2    # 节标题
+_LAYOUT_BLANK = 6      # 空白
+
+
+@lru_cache(maxsize=1)
+def _blank_template_bytes() -> bytes:
+    """默认模板设置为16:9宽屏后的文件内容（进程内只生成一次，之后每个生成器从内存加载）"""
+    prs = Presentation()
+    prs.slide_width = Inches(13.333)
+    prs.slide_height = Inches(7.5)
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
 
 
 class PPTXGenerator:
@@ -28,16 +72,11 @@ class PPTXGenerator:
         """
         初始化生成器，创建空白演示文稿
         """
-        self.prs = Presentation()
-        # 16:9 宽屏
-        self.prs.slide_width = Inches(13.333)
-        self.prs.slide_height = Inches(7.5)
+        # 从缓存的16:9空白模板加载，避免每次都从磁盘读取默认模板
+        self.prs = Presentation(io.BytesIO(_blank_template_bytes()))
         
-
-    
-    def _get_layout_settings(self):
-        """获取布局设置"""
-        return {
+        # 布局设置（幻灯片尺寸固定，只计算一次）
+        self._layout = {
             # Layout Dimensions
             "margin_left": Inches(0.7),
             "margin_top": Inches(0.5),
@@ -47,12 +86,15 @@ class PPTXGenerator:
             "header_height": Inches(0.7),
             "item_spacing": Inches(0.2), # 内容项之间的垂直间距
         }
+        # 内容区可用宽度，以及两栏布局的单栏宽度
+        self._available_width = self.prs.slide_width - self._layout["margin_left"] - self._layout["margin_right"]
+        self._col_width = (self._available_width - self._layout["column_gap"]) / 2
     
     
 
     def create_cover_slide(self, title: str, subtitle: str = "") -> None:
         """创建封面幻灯片"""
-        slide_layout = self.prs.slide_layouts[0]  # 标题幻灯片布局
+        slide_layout = self.prs.slide_layouts[_LAYOUT_TITLE]  # 标题幻灯片布局
         slide = self.prs.slides.add_slide(slide_layout)
         
 
@@ -60,17 +102,17 @@ class PPTXGenerator:
         title_shape.text = title
         p = title_shape.text_frame.paragraphs[0]
         p.font.bold = True
-        p.alignment = PP_ALIGN.CENTER
+        p.alignment = _ALIGN_CENTER
         
         if subtitle and len(slide.placeholders) > 1:
             subtitle_shape = slide.placeholders[1]
             subtitle_shape.text = subtitle
             p = subtitle_shape.text_frame.paragraphs[0]
-            p.alignment = PP_ALIGN.CENTER
+            p.alignment = _ALIGN_CENTER
             
     def create_section_slide(self, section_title: str, section_subtitle: str = "") -> None:
         """创建章节页幻灯片"""
-        slide_layout = self.prs.slide_layouts[2] # 节标题布局
+        slide_layout = self.prs.slide_layouts[_LAYOUT_SECTION] # 节标题布局
         slide = self.prs.slides.add_slide(slide_layout)
         
         # 设置背景
@@ -80,13 +122,13 @@ class PPTXGenerator:
         title_shape.text = section_title
         p = title_shape.text_frame.paragraphs[0]
         p.font.bold = True
-        p.alignment = PP_ALIGN.CENTER
+        p.alignment = _ALIGN_CENTER
 
         body_shape = slide.placeholders[1]
         if section_subtitle:
             body_shape.text = section_subtitle
             p = body_shape.text_frame.paragraphs[0]
-            p.alignment = PP_ALIGN.CENTER
+            p.alignment = _ALIGN_CENTER
         else:
             # 删除未使用的占位符
             sp = body_shape._element
@@ -94,18 +136,17 @@ class PPTXGenerator:
 
     def create_content_slide(self, slide_data: Dict[str, Any]) -> None:
         """根据指定的布局创建正文页幻灯片"""
-        slide_layout = self.prs.slide_layouts[6]  # 空白布局
+        slide_layout = self.prs.slide_layouts[_LAYOUT_BLANK]  # 空白布局
         slide = self.prs.slides.add_slide(slide_layout)
         
-
-        layout_settings = self._get_layout_settings()
+        layout_settings = self._layout
         
         # 添加幻灯片标题
         current_top = layout_settings["margin_top"]
         if "title" in slide_data:
             title_box = slide.shapes.add_textbox(
                 layout_settings["margin_left"], current_top, 
-                self.prs.slide_width - layout_settings["margin_left"] - layout_settings["margin_right"], 
+                self._available_width, 
                 layout_settings["header_height"]
             )
             tf = title_box.text_frame
@@ -126,9 +167,9 @@ class PPTXGenerator:
 
     def _layout_default(self, slide, contents: List[Dict], start_top: float):
         """处理默认的瀑布流布局"""
-        layout_settings = self._get_layout_settings()
+        layout_settings = self._layout
         current_top = start_top
-        available_width = self.prs.slide_width - layout_settings["margin_left"] - layout_settings["margin_right"]
+        available_width = self._available_width
         
         for item in contents:
             item_height = self._add_content_item(slide, item, 
@@ -139,11 +180,17 @@ class PPTXGenerator:
 
     def _layout_two_column(self, slide, contents: List[Dict], start_top: float):
         """处理两栏布局"""
-        layout_settings = self._get_layout_settings()
-        col1_items = [c for c in contents if c.get("column") == 1]
-        col2_items = [c for c in contents if c.get("column") == 2]
-
-        col_width = (self.prs.slide_width - layout_settings["margin_left"] - layout_settings["margin_right"] - layout_settings["column_gap"]) / 2
+        layout_settings = self._layout
+        # 一次遍历按栏位拆分内容（column既不是1也不是2的内容不显示）
+        col1_items, col2_items = [], []
+        for c in contents:
+            column = c.get("column")
+            if column == 1:
+                col1_items.append(c)
+            elif column == 2:
+                col2_items.append(c)
+
+        col_width = self._col_width
         
         # 处理第一栏
         current_top_col1 = start_top
@@ -164,9 +211,8 @@ class PPTXGenerator:
         内容分发器：根据内容类型调用相应的添加方法
         返回: 添加的元素的高度
         """
-        layout_settings = self._get_layout_settings()
         content_type = item.get("type")
-        available_height = self.prs.slide_height - y - layout_settings["margin_bottom"]
+        available_height = self.prs.slide_height - y - self._layout["margin_bottom"]
         if available_height <= 0: return 0
 
         height = 0
@@ -185,8 +231,8 @@ class PPTXGenerator:
 
     def _add_text_content(self, slide, item: Dict, x: float, y: float, width: float, max_height: float) -> float:
         """在一个指定的矩形区域内添加文本内容"""
-        # 预估高度，如果超出则截断
-        estimated_lines = len(item.get("text", "").split('\n')) + len(item.get("bullet_points", []))
+        # 预估高度，如果超出则截断（按换行符计数，不拆分字符串）
+        estimated_lines = item.get("text", "").count('\n') + 1 + len(item.get("bullet_points", ()))
         estimated_height = Inches(estimated_lines * 0.3) # 粗略估计
         height = min(estimated_height, max_height, Inches(4)) # 最大高度为4英寸或可用高度
 
@@ -225,14 +271,7 @@ class PPTXGenerator:
         for series_name, values in item.get("data", {}).get("series", {}).items():
             chart_data.add_series(series_name, values)
             
-        chart_type_map = {
-            "column": XL_CHART_TYPE.COLUMN_CLUSTERED, 
-            "bar": XL_CHART_TYPE.BAR_CLUSTERED,
-            "line": XL_CHART_TYPE.LINE_MARKERS,
-            "pie": XL_CHART_TYPE.PIE, 
-            "area": XL_CHART_TYPE.AREA_STACKED
-        }
-        xl_chart_type = chart_type_map.get(item.get("chart_type", "column"), XL_CHART_TYPE.COLUMN_CLUSTERED)
+        xl_chart_type = _CHART_TYPE_MAP.get(item.get("chart_type", "column"), _DEFAULT_CHART_TYPE)
 
         try:
             # 创建图表
@@ -305,18 +344,23 @@ class PPTXGenerator:
                 # 设置表头样式
                 paragraph = cell.text_frame.paragraphs[0]
                 paragraph.font.bold = True
-                paragraph.alignment = PP_ALIGN.CENTER
+                paragraph.alignment = _ALIGN_CENTER
 
             
-            # 填充数据行（斑马纹效果）
+            # 填充数据行：直接写单元格的OXML，避免每个单元格都经过python-pptx的文本API
+            tr_lst = table._tbl.tr_lst
             for row_idx, row_data in enumerate(rows):
+                tc_lst = tr_lst[row_idx + 1].tc_lst
                 for col_idx, cell_data in enumerate(row_data):
-                    if col_idx < cols:  # 确保不超出列数
+                    if col_idx >= cols:  # 确保不超出列数
+                        break
+                    text = str(cell_data) if cell_data is not None else ""
+                    if _CELL_TEXT_NEEDS_API_RE.search(text):
                         cell = table.cell(row_idx + 1, col_idx)
-                        cell.text = str(cell_data) if cell_data is not None else ""
-                        # 设置数据行样式
-                        paragraph = cell.text_frame.paragraphs[0]
-                        paragraph.alignment = PP_ALIGN.LEFT
+                        cell.text = text
+                        cell.text_frame.paragraphs[0].alignment = _ALIGN_LEFT
+                    else:
+                        self._write_cell_text(tc_lst[col_idx], text)
 
             
             logger.info(f"表格创建成功: {table_title or '未命名表格'} ({table_rows}行 x {cols}列)")
@@ -331,9 +375,17 @@ class PPTXGenerator:
         
         return total_height
 
+    @staticmethod
+    def _write_cell_text(tc, text: str) -> None:
+        """向新建表格的空单元格写入单段左对齐文本（等价于cell.text赋值并设置左对齐）"""
+        p = tc.find(_A_TXBODY).find(_A_P)
+        etree.SubElement(p, _A_PPR).set("algn", _ALGN_LEFT)
+        if text:
+            etree.SubElement(etree.SubElement(p, _A_R), _A_T).text = text
+
     def generate_from_json(self, json_content: Union[str, Dict]):
         """从JSON内容生成完整的演示文稿"""
-        data = json.loads(json_content) if isinstance(json_content, str) else json_content
+        data = orjson.loads(json_content) if isinstance(json_content, str) else json_content
         
         if "slides" not in data:
             raise ValueError("JSON必须包含'slides'字段")
@@ -378,6 +430,7 @@ def create_pptx_from_json(json_content: Union[str, Dict], output_filename: str)
     返回:
         生成的文件路径。
     """
+    generator = None
     try:
         generator = PPTXGenerator()
         generator.generate_from_json(json_content)
@@ -385,6 +438,12 @@ def create_pptx_from_json(json_content: Union[str, Dict], output_filename: str)
     except Exception as e:
         logger.error(f"生成PPTX时发生严重错误: {e}")
         raise
+    finally:
+        # 保存后立即释放演示文稿的OXML树；其各部件之间存在循环引用，需要主动回收
+        if generator is not None:
+            generator.prs = None
+            generator = None
+            gc.collect()
 
 
 class PptCreationTool(ToolHandler):
@@ -409,22 +468,22 @@ class PptCreationTool(ToolHandler):
         output_filename = args.get("output_filename", "output")
         
         if not json_content:
-            return False, json.dumps({
+            return False, orjson.dumps({
                 "error": "缺少PPT内容数据"
-            }, ensure_ascii=False)
+            }).decode()
         
         try:
             file_path = create_pptx_from_json(json_content, output_filename)
-            return True, json.dumps({
+            return True, orjson.dumps({
                 "success": True,
                 "file_path": file_path,
                 "message": f"PPT文件已成功生成：{file_path}"
-            }, ensure_ascii=False)
+            }).decode()
         except Exception as e:
-            return False, json.dumps({
+            return False, orjson.dumps({
                 "success": False,
                 "error": str(e)
-            }, ensure_ascii=False)
+            }).decode()
 
 
 
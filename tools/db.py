@@ -1,91 +1,219 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
 import duckdb
-import json
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Optional, Dict, List, Any, Tuple
+
+import orjson
+
 from .tool_registry import ToolHandler
 
 # --------------------------------------------------------------------------- #
 #                      模块一: 底层清洗和加载函数                  #
 # --------------------------------------------------------------------------- #
 
+# 列名中需要替换为下划线的字符（中文、字母、数字以外的连续字符）
+_COL_RE = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9]+')
+
+
 def clean_column_names_with_replacement(df: pd.DataFrame) -> pd.DataFrame:
     new_columns = []
     _seen = set()
+    _next_suffix: Dict[str, int] = {}  # 每个重名列名下次尝试的后缀编号，避免从1开始重复探测
     for col in df.columns:
-        col_cleaned = str(col).strip()
-        col_cleaned = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9]+', '_', col_cleaned)
-        col_cleaned = col_cleaned.strip('_')
-        if not col_cleaned: col_cleaned = "unnamed_column"
-        original_col, counter = col_cleaned, 1
-        while col_cleaned in _seen:
+        col_cleaned = _COL_RE.sub('_', str(col).strip()).strip('_') or "unnamed_column"
+        if col_cleaned in _seen:
+            original_col = col_cleaned
+            counter = _next_suffix.get(original_col, 1)
             col_cleaned = f"{original_col}_{counter}"
-            counter += 1
+            while col_cleaned in _seen:
+                counter += 1
+                col_cleaned = f"{original_col}_{counter}"
+            _next_suffix[original_col] = counter + 1
         _seen.add(col_cleaned)
         new_columns.append(col_cleaned)
     df.columns = new_columns
     return df
 
+
+def _clean_sheet(df: pd.DataFrame) -> pd.DataFrame:
+    """清洗单个Sheet：规范列名，剔除全空行和全空列。各Sheet互不依赖，可并行执行。"""
+    df_cleaned = clean_column_names_with_replacement(df)
+    # 一次计算空值掩码，同时剔除全空行和全空列，只做一次切片
+    na_mask = df_cleaned.isna().to_numpy()
+    row_mask = ~na_mask.all(axis=1)
+    col_mask = ~na_mask.all(axis=0)
+    df_cleaned = df_cleaned.iloc[row_mask, col_mask].reset_index(drop=True)
+    # 预先生成列名和类型描述，供get_llm_context直接复用
+    df_cleaned.attrs['col_dtypes'] = [f'"{c}" ({t})' for c, t in zip(df_cleaned.columns, df_cleaned.dtypes.astype(str))]
+    return df_cleaned
+
 # --------------------------------------------------------------------------- #
 #               模块二: 数据查询与执行工具 (Tool, 职责单一)                   #
 # --------------------------------------------------------------------------- #
 
+# 不允许执行的语句：事务控制（会提前提交或结束整次调用的事务），以及修改连接设置、挂载数据库、加载扩展等不受事务回滚约束的语句
+_FORBIDDEN_STMT_RE = re.compile(
+    r"\A(?:\s+|--[^\n]*|/\*.*?\*/)*"
+    r"(?:BEGIN|START|COMMIT|END|ROLLBACK|ABORT|SET|RESET|PRAGMA|ATTACH|DETACH|USE|INSTALL|FORCE|LOAD|CHECKPOINT)\b",
+    re.I | re.S
+)
+
+
+def _rollback(con: duckdb.DuckDBPyConnection) -> None:
+    """回滚当前事务；没有进行中的事务时忽略"""
+    try:
+        con.execute("ROLLBACK")
+    except duckdb.TransactionException:
+        pass
+
+
+def _json_default(obj: Any) -> Any:
+    """orjson无法直接序列化的查询结果值：日期时间按固定格式输出，Decimal转为浮点数，其余转为字符串"""
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(obj, date):
+        return obj.strftime('%Y-%m-%d')
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return str(obj)
+
+
+def _big_ints_to_float(value: Any) -> Any:
+    """递归地把超出64位范围的整数转为浮点数，其余值原样返回"""
+    if isinstance(value, int) and not -2**63 <= value < 2**64:
+        return float(value)
+    if isinstance(value, dict):
+        return {k: _big_ints_to_float(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_big_ints_to_float(v) for v in value]
+    return value
+
+
+def _dumps_records(records: Any) -> bytes:
+    """将查询结果序列化为JSON（UTF-8字节）"""
+    try:
+        return orjson.dumps(records, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    except orjson.JSONEncodeError:
+        # orjson不支持超出64位范围的整数（如对BIGINT列SUM得到的HUGEINT），转为浮点数后重新序列化，与fetchdf的结果一致
+        return orjson.dumps(_big_ints_to_float(records), default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def _unique_column_names(columns: List[str]) -> List[str]:
+    """结果列重名时依次改为 名称_2、名称_3 …（与fetchdf的命名一致），避免组装记录时后面的列覆盖前面的列"""
+    if len(set(columns)) == len(columns):
+        return columns
+    taken = set(columns)
+    seen = set()
+    unique = []
+    for name in columns:
+        if name in seen:
+            counter = 2
+            while f"{name}_{counter}" in taken:
+                counter += 1
+            name = f"{name}_{counter}"
+            taken.add(name)
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+
+# SQL词法片段：字符串/美元符号引用的字符串/带引号标识符、注释（其中的分号不是语句分隔符）以及分号本身
+_SQL_SPLIT_RE = re.compile(r"'(?:[^']|'')*'|\$(\w*)\$.*?\$\1\$|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|;", re.S)
+
+
+def _split_sql_statements(sql_query: str) -> List[str]:
+    """
+    按分号拆分多条SQL语句，忽略字符串、美元符号引用的字符串（$$...$$、$tag$...$tag$）、带引号标识符和注释中的分号。
+
+    >>> _split_sql_statements("select 'a;b'; select $$c;d$$; select $t$e;$$;f$t$ -- g;h")
+    ["select 'a;b'", 'select $$c;d$$', 'select $t$e;$$;f$t$ -- g;h']
+    """
+    if ';' not in sql_query:
+        stmt = sql_query.strip()
+        return [stmt] if stmt else []
+    statements = []
+    start = 0
+    for match in _SQL_SPLIT_RE.finditer(sql_query):
+        if match.group() == ';':
+            statements.append(sql_query[start:match.start()])
+            start = match.end()
+    statements.append(sql_query[start:])
+    return [stmt.strip() for stmt in statements if stmt.strip()]
+
+
+def _duckdb_config() -> Dict[str, Any]:
+    """DuckDB连接配置：线程数显式设为CPU核数（避免在Web服务进程中被环境限制），内存上限可通过环境变量DUCKDB_MEMORY_LIMIT设置"""
+    config: Dict[str, Any] = {'threads': os.cpu_count() or 1}
+    memory_limit = os.getenv('DUCKDB_MEMORY_LIMIT')
+    if memory_limit:
+        config['memory_limit'] = memory_limit
+    return config
+
+
 class DataAnalysisToolMultiTable:
-    """一个纯粹的执行工具，接收数据和SQL，返回结果。"""
-    def execute_sql(self, dfs: Dict[str, pd.DataFrame], sql_query: str) -> str:
-        if not isinstance(dfs, dict) or not all(isinstance(df, pd.DataFrame) for df in dfs.values()):
-            return self._format_error("输入参数 'dfs' 必须是一个键为表名，值为Pandas DataFrame的字典。")
-        con: Optional[duckdb.DuckDBPyConnection] = None
+    """一个纯粹的执行工具，接收已注册数据表的DuckDB连接和SQL，返回结果。"""
+    def execute_sql(self, con: duckdb.DuckDBPyConnection, sql_query: str) -> str:
+        if not isinstance(con, duckdb.DuckDBPyConnection):
+            return self._format_error("输入参数 'con' 必须是一个已注册数据表的DuckDB连接。")
         try:
-            con = duckdb.connect(database=':memory:', read_only=False)
-            for table_name, df in dfs.items():
-                con.register(table_name, df)
-            
-            # 分割SQL语句（通过分号分隔）
-            sql_statements = [stmt.strip() for stmt in sql_query.split(';') if stmt.strip()]
+            # 分割SQL语句（通过分号分隔，引号和注释内的分号除外）
+            sql_statements = _split_sql_statements(sql_query)
+            for sql_stmt in sql_statements:
+                if _FORBIDDEN_STMT_RE.match(sql_stmt):
+                    return self._format_error(f"不允许执行事务控制或修改连接设置的语句: {sql_stmt[:100]}")
             
-            if len(sql_statements) == 1:
-                # 单语句查询，返回原格式
-                result_df = con.execute(sql_statements[0]).fetchdf()
-                return self._prepare_dataframe_for_json(result_df).to_json(orient='records', date_format='iso', default_handler=str)
-            else:
-                # 多语句查询，返回结果列表
-                results = []
-                for i, sql_stmt in enumerate(sql_statements):
-                    try:
-                        result_df = con.execute(sql_stmt).fetchdf()
-                        results.append({
-                            "query_index": i + 1,
-                            "sql": sql_stmt[:100] + "..." if len(sql_stmt) > 100 else sql_stmt,
-                            "result": json.loads(self._prepare_dataframe_for_json(result_df).to_json(orient='records', date_format='iso', default_handler=str)),
-                            "row_count": len(result_df),
-                            "column_count": len(result_df.columns)
-                        })
-                    except Exception as e:
-                        results.append({
-                            "query_index": i + 1,
-                            "sql": sql_stmt[:100] + "..." if len(sql_stmt) > 100 else sql_stmt,
-                            "error": str(e)
-                        })
-                return json.dumps({"multiple_queries": True, "results": results}, ensure_ascii=False)
+            # 整次调用在一个事务中执行，结束后回滚：同一次调用中的语句可以使用前面语句创建的临时表等，
+            # 而连接在整个会话内复用，回滚保证查询对数据表的修改（DELETE/UPDATE/DROP/CREATE等）不会保留，源数据保持只读
+            con.execute("BEGIN TRANSACTION")
+            try:
+                if len(sql_statements) == 1:
+                    # 单语句查询，返回原格式
+                    records, _ = self._fetch_records(con, sql_statements[0])
+                    return _dumps_records(records).decode()
+                else:
+                    # 多语句查询，返回结果列表：逐条序列化后直接拼接JSON片段，每条语句的结果序列化后即可释放
+                    parts = []
+                    for i, sql_stmt in enumerate(sql_statements):
+                        sql_preview = sql_stmt[:100] + "..." if len(sql_stmt) > 100 else sql_stmt
+                        try:
+                            records, column_count = self._fetch_records(con, sql_stmt)
+                            parts.append(b'{"query_index":%d,"sql":%b,"result":%b,"row_count":%d,"column_count":%d}' % (
+                                i + 1, orjson.dumps(sql_preview), _dumps_records(records), len(records), column_count
+                            ))
+                        except Exception as e:
+                            parts.append(orjson.dumps({
+                                "query_index": i + 1,
+                                "sql": sql_preview,
+                                "error": str(e)
+                            }))
+                            # 执行出错可能使事务进入中止状态，回滚后重新开始事务，后续语句仍可执行
+                            _rollback(con)
+                            con.execute("BEGIN TRANSACTION")
+                    return (b'{"multiple_queries":true,"results":[' + b','.join(parts) + b']}').decode()
+            finally:
+                _rollback(con)
                 
         except duckdb.Error as e:
             return self._format_error(f"SQL执行失败: {e}")
         except Exception as e:
             return self._format_error(f"数据处理失败: {e}")
-        finally:
-            if con: con.close()
-
-    def _prepare_dataframe_for_json(self, df: pd.DataFrame) -> pd.DataFrame:
-        df_copy = df.copy()
-        for col in df_copy.columns:
-            if pd.api.types.is_datetime64_any_dtype(df_copy[col]):
-                df_copy[col] = df_copy[col].dt.strftime('%Y-%m-%d %H:%M:%S')
-        return df_copy
+
+    def _fetch_records(self, con: duckdb.DuckDBPyConnection, sql: str) -> Tuple[List[Dict[str, Any]], int]:
+        """执行单条SQL，直接从DuckDB取回行数据并组装为记录列表，返回(记录列表, 列数)"""
+        cursor = con.execute(sql)
+        if cursor.description is None:
+            return [], 0
+        columns = _unique_column_names([column[0] for column in cursor.description])
+        return [dict(zip(columns, row)) for row in cursor.fetchall()], len(columns)
     
     def _format_error(self, message: str) -> str:
-        return json.dumps({"error": message}, ensure_ascii=False)
+        return orjson.dumps({"error": message}).decode()
 
 
 # --------------------------------------------------------------------------- #
@@ -102,56 +230,132 @@ class ExcelAnalysisOrchestrator:
         """
         print("--- 协调器初始化：开始数据发现与描述 ---")
         self.file_path = file_path
-        self.data_tables: Dict[str, pd.DataFrame] = self._load_and_clean_all_sheets()
         self.tool = DataAnalysisToolMultiTable()
+        # 常驻的DuckDB连接：数据表只导入一次，每次查询从它派生独立的cursor，可多线程并发查询
+        self.con: Optional[duckdb.DuckDBPyConnection] = duckdb.connect(database=':memory:', read_only=False, config=_duckdb_config())
+        self._con_lock = threading.Lock()
+        # 每个Sheet清洗完即导入DuckDB并生成上下文描述，随后释放DataFrame，数据只在DuckDB中存一份
+        self._llm_context = self._build_llm_context(self._load_and_import_all_sheets())
         print("--- 协调器准备就绪 ---\n")
 
-    def _load_and_clean_all_sheets(self) -> Dict[str, pd.DataFrame]:
+    def refresh_registrations(self, data_tables: Dict[str, pd.DataFrame]):
         """
-        加载Excel中的所有Sheet，并对每一个进行清洗。
+        将数据表（重新）导入DuckDB，数据表变化后调用。
+        """
+        for table_name, df in data_tables.items():
+            self._import_table(table_name, df)
+
+    def _import_table(self, table_name: str, df: pd.DataFrame):
+        """
+        将DataFrame复制为DuckDB原生列式表：查询时不再逐行扫描pandas的Python对象列，且对所有cursor可见。
+        """
+        quoted_name = '"' + table_name.replace('"', '""') + '"'
+        with self._con_lock:
+            self.con.register("__excel_source", df)
+            try:
+                self.con.execute(f"CREATE OR REPLACE TABLE {quoted_name} AS SELECT * FROM __excel_source")
+            finally:
+                self.con.unregister("__excel_source")
+
+    def _drop_tables(self, table_names):
+        """删除已导入的数据表（读取中途失败时清理）"""
+        with self._con_lock:
+            for table_name in table_names:
+                quoted_name = '"' + table_name.replace('"', '""') + '"'
+                self.con.execute(f"DROP TABLE IF EXISTS {quoted_name}")
+
+    def close(self):
+        """关闭DuckDB连接，释放已导入的数据表"""
+        with self._con_lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+    def _load_and_import_all_sheets(self) -> Dict[str, str]:
+        """
+        加载Excel中的所有Sheet，逐个清洗并导入DuckDB，返回 {表名: 上下文描述}。
         """
         try:
-            all_sheets_dict = pd.read_excel(self.file_path, sheet_name=None, engine='openpyxl')
+            # 优先使用calamine（Rust实现，读取速度快、内存占用低）
+            return self._import_sheets('calamine')
         except Exception as e:
-            print(f"❌ [ERROR] 无法读取Excel文件: {e}")
-            return {}
-            
-        cleaned_tables = {}
-        for sheet_name, df in all_sheets_dict.items():
-            print(f"  -> 正在处理Sheet: '{sheet_name}'")
-            # 清洗列名
-            df_cleaned = clean_column_names_with_replacement(df.copy())
-            df_cleaned.dropna(how='all', axis=0, inplace=True)
-            df_cleaned.dropna(how='all', axis=1, inplace=True)
-            df_cleaned.reset_index(drop=True, inplace=True)
-            
-            # 使用一个更安全的、适合做表名的key
-            table_key = re.sub(r'\W+', '', sheet_name).lower()
-            if not table_key: table_key = f"sheet_{len(cleaned_tables)}"
-            cleaned_tables[table_key] = df_cleaned
-        return cleaned_tables
+            print(f"⚠️ [WARN] calamine读取失败，改用openpyxl: {e}")
+            try:
+                # 以只读流式模式读取，不构建完整的单元格对象树
+                return self._import_sheets(
+                    'openpyxl', {'read_only': True, 'data_only': True, 'keep_links': False}
+                )
+            except Exception as e:
+                print(f"❌ [ERROR] 无法读取Excel文件: {e}")
+                return {}
+
+    def _import_sheets(self, engine: str, engine_kwargs: Optional[dict] = None) -> Dict[str, str]:
+        """
+        逐个Sheet读取、清洗并导入DuckDB，返回按Sheet顺序排列的 {表名: 上下文描述}。
+        清洗在后台线程中与下一个Sheet的读取重叠；每个Sheet导入并生成描述后即释放DataFrame，
+        内存中同时最多只有正在读取和正在清洗/导入的两个Sheet。中途失败时删除本次已导入的表。
+        """
+        descriptions: Dict[str, str] = {}
+        try:
+            with pd.ExcelFile(self.file_path, engine=engine, engine_kwargs=engine_kwargs) as xls, \
+                    ThreadPoolExecutor(max_workers=1) as executor:
+                pending = None
+                for sheet_name in xls.sheet_names:
+                    future = executor.submit(_clean_sheet, xls.parse(sheet_name))
+                    if pending is not None:
+                        self._import_sheet(pending[0], pending[1].result(), descriptions)
+                    pending = (sheet_name, future)
+                if pending is not None:
+                    self._import_sheet(pending[0], pending[1].result(), descriptions)
+        except Exception:
+            self._drop_tables(descriptions)
+            raise
+        return descriptions
+
+    def _import_sheet(self, sheet_name: str, df_cleaned: pd.DataFrame, descriptions: Dict[str, str]):
+        """
+        将清洗后的Sheet导入DuckDB，并把它的上下文描述记入descriptions。
+        """
+        print(f"  -> 正在处理Sheet: '{sheet_name}'")
+        df_cleaned.attrs['original_sheet_name'] = sheet_name
+        # 使用一个更安全的、适合做表名的key
+        table_key = re.sub(r'\W+', '', sheet_name).lower()
+        if not table_key: table_key = f"sheet_{len(descriptions)}"
+        self._import_table(table_key, df_cleaned)
+        descriptions[table_key] = self._describe_table(table_key, df_cleaned)
 
     def get_llm_context(self) -> str:
+        """
+        返回给LLM提供上下文的结构化字符串（加载时已生成）。
+        """
+        return self._llm_context
+
+    def _build_llm_context(self, table_descriptions: Dict[str, str]) -> str:
         """
         生成一个结构化的字符串，用于给LLM提供上下文。
         """
-        if not self.data_tables:
+        if not table_descriptions:
             return "错误：未能从Excel文件中加载任何数据。"
-        
-        context_parts = ["用户上传的Excel文件内容如下："]
-        for table_name, df in self.data_tables.items():
-            context_parts.append(f"\n--- 表名: `{table_name}` (来自Sheet: '{df.attrs.get('original_sheet_name', table_name)}') ---")
-            
-            # 列信息
-            columns_info = []
-            for col in df.columns:
-                dtype = str(df[col].dtype)
-                columns_info.append(f'"{col}" ({dtype})')
-            context_parts.append("列名和类型: " + ", ".join(columns_info))
-
-            # 数据预览
+        return "\n".join(["用户上传的Excel文件内容如下：", *table_descriptions.values()])
+
+    def _describe_table(self, table_name: str, df: pd.DataFrame) -> str:
+        """
+        生成单个数据表的上下文描述：表名、列名和类型、数据预览。
+        """
+        context_parts = [f"\n--- 表名: `{table_name}` (来自Sheet: '{df.attrs.get('original_sheet_name', table_name)}') ---"]
+
+        # 列信息（优先使用加载时缓存的描述，否则一次性转换全部列类型）
+        columns_info = df.attrs.get('col_dtypes')
+        if columns_info is None:
+            columns_info = (f'"{c}" ({t})' for c, t in zip(df.columns, df.dtypes.astype(str)))
+        context_parts.append("列名和类型: " + ", ".join(columns_info))
+
+        # 数据预览：to_csv走C实现的写出器，比to_string的格式化器快得多；过宽的表只取前20列
+        if df.shape[1] > 20:
+            context_parts.append(f"数据预览 (前5行，前20列，共{df.shape[1]}列):")
+        else:
             context_parts.append("数据预览 (前5行):")
-            context_parts.append(df.head(5).to_string(index=False))
+        context_parts.append(df.iloc[:5, :20].to_csv(index=False, sep='\t').rstrip('\n'))
 
         return "\n".join(context_parts)
 
@@ -160,7 +364,14 @@ class ExcelAnalysisOrchestrator:
         执行"数据查询与执行"阶段。
         """
         print("--- 协调器开始执行分析任务 ---")
-        return self.tool.execute_sql(self.data_tables, sql_query)
+        with self._con_lock:
+            if self.con is None:
+                return self.tool._format_error("数据连接已关闭，请重新上传Excel文件")
+            cursor = self.con.cursor()
+        try:
+            return self.tool.execute_sql(cursor, sql_query)
+        finally:
+            cursor.close()
 
 
 # --------------------------------------------------------------------------- #
@@ -174,6 +385,11 @@ class SqlExecutionTool(ToolHandler):
     def name(self) -> str:
         return "execute_sql"
     
+    @property
+    def cache_ttl(self) -> float:
+        # 查询只读且数据加载后不再变化，相同SQL的结果可以复用
+        return 300
+    
     def execute(self, args: Dict[str, Any], context: Dict[str, Any]) -> Tuple[bool, str]:
         """
         执行SQL查询
@@ -187,21 +403,21 @@ class SqlExecutionTool(ToolHandler):
         """
         excel_orchestrator = context.get("excel_orchestrator")
         if not excel_orchestrator:
-            return False, json.dumps({
+            return False, orjson.dumps({
                 "error": "请先上传Excel文件"
-            }, ensure_ascii=False)
+            }).decode()
         
         sql_query = args.get("sql_query", "")
         if not sql_query:
-            return False, json.dumps({
+            return False, orjson.dumps({
                 "error": "缺少SQL查询语句"
-            }, ensure_ascii=False)
+            }).decode()
         
         try:
             result = excel_orchestrator.run_analysis(sql_query)
             return True, result
         except Exception as e:
-            return False, json.dumps({
+            return False, orjson.dumps({
                 "error": f"SQL执行失败：{str(e)}"
-            }, ensure_ascii=False)
+            }).decode()
 
@@ -11,38 +11,62 @@
 
 from __future__ import annotations
 
-import json
 import logging
 import re
 import time
 import uuid
+from collections import OrderedDict
+from html import escape as _esc
+from itertools import count, islice
 from typing import Any, Dict, Optional, Tuple
 
+import orjson
+
 
 logger = logging.getLogger(__name__)
 
+# 正则匹配形如 {"execute_sql":"var_123"} 的最小对象片段
+_PLACEHOLDER_RE = re.compile(r"\{\s*\"([a-zA-Z0-9_]+)\"\s*:\s*\"([a-zA-Z0-9_\-:.]+)\"\s*\}")
+
+
+def _build_placeholder_pattern(tool_names) -> re.Pattern:
+    """构建只匹配指定工具名的占位符正则，未知工具的片段在正则层面就不会匹配"""
+    tools_alt = "|".join(map(re.escape, sorted(tool_names, key=len, reverse=True)))
+    return re.compile(r"\{\s*\"(" + tools_alt + r")\"\s*:\s*\"([a-zA-Z0-9_\-:.]+)\"\s*\}")
+
+
+# 表格ID计数器：从进程启动时的毫秒时间戳开始递增，同一毫秒内渲染多个表格也不会重复
+_table_ids = count(int(time.time() * 1000))
+
+
+def _dumps(value: Any) -> str:
+    """序列化绑定值为JSON字符串（orjson，支持非字符串键和NumPy类型）"""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
 
 class MessageVariableProcessor:
     """管理工具结果的变量绑定与占位符替换。"""
 
     def __init__(self, max_store_items: int = 50, preview_max_items: int = 50, preview_max_chars: int = 2000):
-        # 存储结构：{ (tool_name, var_name): payload_dict }
-        self._store: Dict[Tuple[str, str], Any] = {}
-        self._order: list[Tuple[str, str]] = []  # 用于LRU裁剪
+        # 存储结构：{ (tool_name, var_name): payload_dict }，插入顺序即LRU顺序
+        self._store: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
         self.max_store_items = max_store_items
         self.preview_max_items = preview_max_items
         self.preview_max_chars = preview_max_chars
 
         # 已注册的工具名，用于占位符解析中的白名单匹配（可选）
         self._known_tools: set[str] = set()
+        # 当前使用的占位符正则：登记已知工具后只匹配这些工具
+        self._pattern: re.Pattern = _PLACEHOLDER_RE
         
         # 存储完整表格数据供复制功能使用
         self._table_data_store: Dict[str, Dict[str, Any]] = {}
 
     def register_known_tool(self, tool_name: str):
         """登记一个可识别的工具名，提升占位符匹配的准确度。"""
-        if tool_name:
+        if tool_name and tool_name not in self._known_tools:
             self._known_tools.add(tool_name)
+            self._pattern = _build_placeholder_pattern(self._known_tools)
 
     def register_binding(self, tool_name: str, value: Any, var_name: Optional[str] = None) -> str:
         """注册一个变量绑定，并返回变量名。"""
@@ -50,7 +74,7 @@ class MessageVariableProcessor:
             var_name = f"{tool_name}_{int(time.time()*1000)}_{uuid.uuid4().hex[:8]}"
         key = (tool_name, var_name)
         self._store[key] = value
-        self._order.append(key)
+        self._store.move_to_end(key)
         self._evict_if_necessary()
         logger.info(f"变量绑定已注册: tool={tool_name}, var={var_name}")
         return var_name
@@ -78,36 +102,40 @@ class MessageVariableProcessor:
         if include_preview:
             payload["variable_binding"]["preview"] = self._make_preview(original_value)
         payload["variable_binding"]["size_hint"] = self._size_hint(original_value)
-        return json.dumps(payload, ensure_ascii=False)
+        return orjson.dumps(payload).decode()
+
+    def resolve_placeholders_in_text(self, text: Optional[str], render: str = "html") -> str:
+        """将文本中的占位符 {"<tool>":"<var_name>"} 替换为绑定的真实数据。
 
-    def resolve_placeholders_in_text(self, text: Optional[str]) -> str:
-        """将文本中的占位符 {"<tool>":"<var_name>"} 替换为绑定的真实数据(JSON字符串)。"""
+        render="html"：SQL查询结果渲染为HTML表格（聊天界面展示用）；
+        render="json"：一律替换为JSON字符串，跳过HTML渲染（结果需再做JSON解析时使用）。
+        """
         if not text:
             return text or ""
+        # 不含 '{' 的文本不可能有占位符，直接返回，省去正则扫描
+        if '{' not in text:
+            return text
 
-        # 正则匹配形如 {"execute_sql":"var_123"} 的最小对象片段
-        pattern = re.compile(r"\{\s*\"([a-zA-Z0-9_]+)\"\s*:\s*\"([a-zA-Z0-9_\-:.]+)\"\s*\}")
-
-        def replacer(match: re.Match) -> str:
-            tool = match.group(1)
-            var = match.group(2)
-            # 若登记了已知工具，则仅对已知工具进行替换
-            if self._known_tools and tool not in self._known_tools:
-                return match.group(0)
-            value = self.get_binding(tool, var)
-            if value is None:
-                return match.group(0)
-            try:
-                # 对于SQL查询结果，生成HTML表格格式
-                if tool == "execute_sql":
-                    return self._format_sql_result_as_html_table(value)
-                else:
-                    return json.dumps(value, ensure_ascii=False)
-            except Exception:
-                # 如果无法序列化，退回原样
-                return match.group(0)
+        # 单次扫描文本，每个匹配通过回调查表替换
+        as_html = render == "html"
+        return self._pattern.sub(lambda match: self._replace_placeholder(match, as_html), text)
 
-        return pattern.sub(replacer, text)
+    def _replace_placeholder(self, match: re.Match, as_html: bool = True) -> str:
+        """re.sub回调：将单个占位符替换为绑定的真实数据。"""
+        tool = match.group(1)
+        var = match.group(2)
+        value = self.get_binding(tool, var)
+        if value is None:
+            return match.group(0)
+        try:
+            # 对于SQL查询结果，按需生成HTML表格格式
+            if as_html and tool == "execute_sql":
+                return self._format_sql_result_as_html_table(value)
+            else:
+                return _dumps(value)
+        except Exception:
+            # 如果无法序列化，退回原样
+            return match.group(0)
     
     def _format_sql_result_as_html_table(self, value: Any) -> str:
         """将SQL查询结果格式化为HTML表格"""
@@ -120,7 +148,7 @@ class MessageVariableProcessor:
                         html_parts.append(f"""
                         <div class="query-result-section">
                             <h4>查询 {result_item.get('query_index', i+1)}</h4>
-                            <div class="error-message">❌ {result_item['error']}</div>
+                            <div class="error-message">❌ {_esc(str(result_item['error']))}</div>
                         </div>
                         """)
                     else:
@@ -131,7 +159,7 @@ class MessageVariableProcessor:
                         table_html = self._create_html_table(result_item.get("result", []))
                         html_parts.append(f"""
                         <div class="query-result-section">
-                            <h4>查询 {result_item.get('query_index', i+1)}: {sql_preview}</h4>
+                            <h4>查询 {result_item.get('query_index', i+1)}: {_esc(sql_preview)}</h4>
                             <div class="result-stats">行数: {result_item.get('row_count', 0)} | 列数: {result_item.get('column_count', 0)}</div>
                             {table_html}
                         </div>
@@ -144,15 +172,15 @@ class MessageVariableProcessor:
             
             # 处理错误情况
             elif isinstance(value, dict) and "error" in value:
-                return f'<div class="error-message">❌ {value["error"]}</div>'
+                return f'<div class="error-message">❌ {_esc(str(value["error"]))}</div>'
             
             # 其他情况回退到JSON
             else:
-                return json.dumps(value, ensure_ascii=False)
+                return _dumps(value)
                 
         except Exception as e:
             logger.error(f"格式化SQL结果为表格失败: {e}")
-            return json.dumps(value, ensure_ascii=False)
+            return _dumps(value)
     
     def _create_html_table(self, data: list) -> str:
         """创建HTML表格"""
@@ -160,19 +188,17 @@ class MessageVariableProcessor:
             return '<div class="no-data">暂无数据</div>'
         
         # 获取表头（假设所有行都有相同的键）
-        if len(data) == 0:
-            return '<div class="no-data">暂无数据</div>'
-        
         headers = list(data[0].keys()) if isinstance(data[0], dict) else []
         if not headers:
             return '<div class="no-data">数据格式错误</div>'
         
-        # 限制显示行数，避免页面过长
-        display_data = data[:100]  # 最多显示100行
-        show_more = len(data) > 100
+        # 限制显示行数，避免页面过长：只迭代前100行，不切片复制整个列表
+        total_rows = len(data)
+        display_rows = min(total_rows, 100)  # 最多显示100行
+        show_more = total_rows > 100
         
         # 生成唯一的表格ID和数据ID
-        table_id = f"table_{int(time.time()*1000)}"
+        table_id = f"table_{next(_table_ids)}"
         data_id = f"data_{table_id}"
         
         # 将完整数据存储到全局变量中，供复制功能使用
@@ -185,7 +211,7 @@ class MessageVariableProcessor:
         html_parts.append(f'''
         <div class="table-toolbar">
             <div class="table-info">
-                数据行数: {len(display_data)} / {len(data)}
+                数据行数: {display_rows} / {total_rows}
             </div>
             <div class="table-actions">
                 <button class="copy-table-btn" onclick="copyFullTableData('{data_id}')" title="复制全部表格数据">
@@ -203,39 +229,25 @@ class MessageVariableProcessor:
         
         # 表头
         html_parts.append('<thead><tr>')
-        for header in headers:
-            html_parts.append(f'<th>{str(header)}</th>')
+        html_parts.extend(f'<th>{_esc(str(header))}</th>' for header in headers)
         html_parts.append('</tr></thead>')
         
-        # 表体
+        # 表体：每个单元格只转换、转义一次
         html_parts.append('<tbody>')
-        for row in display_data:
+        for row in islice(data, display_rows):
             html_parts.append('<tr>')
             for header in headers:
                 cell_value = row.get(header, '')
-                display_value = ''  # 初始化display_value
-
-                # 处理特殊值
-                if cell_value is None:
-                    cell_value = ''
-                    display_value = ''
-                elif isinstance(cell_value, (int, float)):
-                    cell_value = str(cell_value)
-                    display_value = cell_value
-                else:
-                    cell_value = str(cell_value)
-                    # 限制单元格内容长度（用于显示，但保存原始值到data属性）
-                    display_value = cell_value
-                    if len(display_value) > 100:
-                        display_value = display_value[:97] + "..."
-                escaped_value = str(cell_value).replace('"', '&quot;')
-                html_parts.append(f'<td data-value="{escaped_value}">{display_value}</td>')
+                cell_value = '' if cell_value is None else str(cell_value)
+                # 限制单元格内容长度（用于显示，但保存原始值到data属性）
+                display_value = cell_value if len(cell_value) <= 100 else cell_value[:97] + "..."
+                html_parts.append(f'<td data-value="{_esc(cell_value)}">{_esc(display_value, quote=False)}</td>')
             html_parts.append('</tr>')
         html_parts.append('</tbody>')
         html_parts.append('</table>')
         
         if show_more:
-            html_parts.append(f'<div class="table-more-info">显示前100行，共{len(data)}行数据。复制功能将包含全部{len(data)}行数据。</div>')
+            html_parts.append(f'<div class="table-more-info">显示前100行，共{total_rows}行数据。复制功能将包含全部{total_rows}行数据。</div>')
         
         html_parts.append('</div>')  # 结束table-container
         
@@ -263,9 +275,8 @@ class MessageVariableProcessor:
     # ---------------------------- 内部工具函数 ---------------------------- #
 
     def _evict_if_necessary(self):
-        while len(self._order) > self.max_store_items:
-            old_key = self._order.pop(0)
-            self._store.pop(old_key, None)
+        while len(self._store) > self.max_store_items:
+            old_key, _ = self._store.popitem(last=False)
             logger.info(f"变量绑定被回收: tool={old_key[0]}, var={old_key[1]}")
 
     def _make_preview(self, value: Any) -> Any:
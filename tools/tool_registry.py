@@ -3,11 +3,12 @@
 工具注册器 - 管理所有可用工具的注册和执行
 """
 
-import json
 import logging
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Tuple, Optional, Type
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +21,11 @@ class ToolHandler(ABC):
         """工具名称"""
         pass
     
+    @property
+    def cache_ttl(self) -> float:
+        """结果缓存时间（秒），相同参数在该时间内重复调用时直接复用结果；0表示不缓存（有副作用的工具应保持为0）"""
+        return 0
+    
     @abstractmethod
     def execute(self, args: Dict[str, Any], context: Dict[str, Any]) -> Tuple[bool, str]:
         """
@@ -60,6 +66,11 @@ class ToolRegistry:
         """列出所有已注册的工具"""
         return list(self._handlers.keys())
         
+    def get_cache_ttl(self, tool_name: str) -> float:
+        """获取工具的结果缓存时间（秒），未知工具返回0"""
+        handler = self.get_handler(tool_name)
+        return handler.cache_ttl if handler else 0
+        
     def execute_tool(self, tool_name: str, args: Dict[str, Any], context: Dict[str, Any]) -> Tuple[str, str]:
         """
         执行指定工具
@@ -74,15 +85,15 @@ class ToolRegistry:
         """
         handler = self.get_handler(tool_name)
         if not handler:
-            return tool_name, json.dumps({
+            return tool_name, orjson.dumps({
                 "error": f"未知的工具：{tool_name}"
-            }, ensure_ascii=False)
+            }).decode()
             
         try:
             success, result = handler.execute(args, context)
             return tool_name, result
         except Exception as e:
             logger.error(f"工具 {tool_name} 执行失败: {e}")
-            return tool_name, json.dumps({
+            return tool_name, orjson.dumps({
                 "error": f"工具执行失败：{str(e)}"
-            }, ensure_ascii=False)
+            }).decode()
@@ -3,27 +3,37 @@
 FastAPI Web应用 - PPT生成工具的Web版本
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
-import uuid
+import re
+import secrets
+import stat
+import time
 import asyncio
+import gzip
+import hashlib
 import logging
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 import json
-import shutil
 from pathlib import Path
+from urllib.parse import parse_qs
 import webbrowser
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiofiles
+import orjson
 
 # 导入现有的服务
 from dialogue_service import DialogueService
-from config_manager import ConfigManager
+from llm_client import OpenAIConnector
+from config_manager import config_manager
 from path_manager import path_manager
+from session_store import SessionStore
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -33,7 +43,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="PPT生成工具",
     description="基于AI的Excel数据分析与PPT自动生成系统",
-    version="2.0.0"
+    version="2.0.0",
+    # 所有JSON接口默认使用orjson序列化
+    default_response_class=ORJSONResponse
 )
 
 # 启用CORS
@@ -56,16 +68,162 @@ async def on_startup():
     # 延迟1秒后打开浏览器，确保Uvicorn服务已准备就绪
     threading.Timer(1, open_browser).start()
 
+    # 主页面内容运行期间不会变化，启动时读取一次
+    global INDEX_HTML
+    index_path = path_manager.get_resource_path("static/index.html")
+    INDEX_HTML = _versioned_index_html(index_path.read_bytes()) if index_path.exists() else None
+
+    # 启动后台清理协程，定期回收闲置的会话和过期的任务状态
+    spawn(sessions.run_janitor(JANITOR_INTERVAL_SECONDS))
+    spawn(task_status.run_janitor(JANITOR_INTERVAL_SECONDS))
+
+    # 预先创建全局共享的LLM客户端（HTTP连接池等），首次上传时不再承担这部分初始化开销
+    spawn(_prewarm_llm_client())
+
+
+async def _prewarm_llm_client():
+    """在线程中创建LLM客户端；失败只记录警告，首次使用时会再次创建"""
+    try:
+        await asyncio.to_thread(OpenAIConnector)
+    except Exception as e:
+        logger.warning(f"预先创建LLM客户端失败: {e}")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    应用关闭时取消所有未完成的后台任务并等待其退出。
+    """
+    for task in BG_TASKS:
+        task.cancel()
+    await asyncio.gather(*BG_TASKS, return_exceptions=True)
+
 
 # 注意：不需要手动创建目录，path_manager的get_*_path方法会自动创建可写目录
 
 
-# 配置管理器
-config_manager = ConfigManager()
+# 将配置应用到环境变量
 config_manager.apply_to_environment()
 
-# 会话管理
-sessions: Dict[str, DialogueService] = {}
+# 上传文件分块写盘的块大小（1 MiB，4 KiB对齐）
+UPLOAD_CHUNK_SIZE = 1 << 20
+# 上传文件大小上限（字节），可通过环境变量MAX_UPLOAD_BYTES调整，默认100 MiB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 << 20)))
+# 按Content-Length预检上传大小时，为multipart边界和字段头预留的余量
+UPLOAD_FORM_OVERHEAD = 64 << 10
+# Excel文件头：.xlsx为ZIP格式，.xls为OLE2复合文档格式
+_EXCEL_MAGIC = (b"PK\x03\x04", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1")
+
+# 执行阻塞操作（Excel解析、LLM调用）的线程池，避免阻塞事件循环
+EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="web-worker")
+
+# 同时进行的PPT生成任务上限，可通过环境变量MAX_CONCURRENT_PPT调整
+MAX_CONCURRENT_PPT = int(os.getenv("MAX_CONCURRENT_PPT", str(max(1, (os.cpu_count() or 1) // 2))))
+PPT_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_PPT)
+
+# 会话闲置超过该时长（秒）后被回收
+SESSION_TTL_SECONDS = 30 * 60
+# 任务状态保留时长（秒）
+TASK_STATUS_TTL_SECONDS = 60 * 60
+# 后台清理间隔（秒）
+JANITOR_INTERVAL_SECONDS = 60
+
+# 会话管理：分片存储，闲置过期的会话会被关闭并移除
+sessions = SessionStore(SESSION_TTL_SECONDS, on_evict=DialogueService.close)
+# 任务状态存储：{ task_id: 序列化后的状态JSON字节 }
+task_status = SessionStore(TASK_STATUS_TTL_SECONDS)
+# 任务状态变化通知：每个未结束的任务一个Event，状态更新时触发并换成新的Event
+_task_events: Dict[str, asyncio.Event] = {}
+# 任务结束状态
+TASK_FINAL_STATES = ("completed", "failed")
+# 主页面内容（启动时加载）
+INDEX_HTML: Optional[bytes] = None
+
+# 正在运行的后台任务：事件循环只持有任务的弱引用，这里保留强引用直到任务结束
+BG_TASKS: Set[asyncio.Task] = set()
+
+
+# 最近一次格式化的整秒时间：(秒级时间戳, "YYYY-MM-DDTHH:MM:SS")，整体替换，线程间读取一致
+_iso_second_cache = (None, "")
+
+def _utc_iso(timestamp: float) -> str:
+    """将时间戳格式化为UTC ISO 8601字符串（毫秒精度），同一秒内复用已格式化的秒级部分"""
+    global _iso_second_cache
+    second = int(timestamp)
+    cache = _iso_second_cache
+    if cache[0] != second:
+        cache = (second, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second)))
+        _iso_second_cache = cache
+    return f"{cache[1]}.{int((timestamp - second) * 1000):03d}Z"
+
+def _now_iso() -> str:
+    return _utc_iso(time.time())
+
+
+def new_id() -> str:
+    """生成会话/任务ID：16字节随机数的URL安全编码（22个字符）"""
+    return secrets.token_urlsafe(16)
+
+
+def spawn(coro) -> asyncio.Task:
+    """创建后台任务并登记到BG_TASKS，任务结束后自动移除"""
+    task = asyncio.create_task(coro)
+    BG_TASKS.add(task)
+    task.add_done_callback(BG_TASKS.discard)
+    return task
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """
+    ASGI服务器声明支持 http.response.zerocopysend 扩展时，直接把文件交给服务器用sendfile(2)发送，
+    文件内容不经过Python缓冲区；不支持时退回FileResponse的分块读取。
+    需要在构造时传入stat_result，以便提前写好Content-Length等响应头。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.stat_result is None or "http.response.zerocopysend" not in scope.get("extensions", {}):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file, "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+class UploadSizeLimitMiddleware:
+    """
+    在解析请求体之前，按Content-Length直接拒绝超过上限的上传请求。
+    Starlette在调用处理函数前会把整个multipart请求体缓存到临时文件，处理函数内的大小检查只能在缓存完成后进行；
+    未携带Content-Length的请求（分块传输）仍由_save_upload在写盘时检查。
+    """
+
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"] == self.path:
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_bytes + UPLOAD_FORM_OVERHEAD:
+                response = JSONResponse(
+                    {"detail": f"文件过大，最大允许 {self.max_bytes // (1 << 20)} MB"},
+                    status_code=413,
+                    headers={"Connection": "close"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware, path="/api/upload-excel", max_bytes=MAX_UPLOAD_BYTES)
+
 
 # 数据模型
 class ChatMessage(BaseModel):
@@ -86,10 +244,36 @@ class ConfigUpdate(BaseModel):
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """返回主页面"""
-    index_path = path_manager.get_resource_path("static/index.html")
-    if not index_path.exists():
+    if INDEX_HTML is None:
         return HTMLResponse(content="<html><body><h1>欢迎使用PPT生成工具</h1><p>主页面文件丢失。</p></body></html>", status_code=404)
-    return HTMLResponse(content=index_path.read_text(encoding="utf-8"))
+    # 主页面不长期缓存，每次向服务器确认，保证更新后能拿到新的资源URL
+    return HTMLResponse(content=INDEX_HTML, headers={"Cache-Control": "no-cache"})
+
+async def _save_upload(file: UploadFile, temp_path: Path) -> None:
+    """
+    分块异步写盘，写入期间事件循环可继续处理其他请求。
+    第一块即校验Excel文件头，并累计已写入的大小，超过上限立即中止。
+    此时请求体已由Starlette完整接收；声明了过大Content-Length的请求在此之前已被UploadSizeLimitMiddleware拒绝。
+    """
+    total = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if total == 0 and not chunk.startswith(_EXCEL_MAGIC):
+                    raise HTTPException(status_code=400, detail="文件内容不是有效的Excel文件")
+                total += len(chunk)
+                if total > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"文件过大，最大允许 {MAX_UPLOAD_BYTES // (1 << 20)} MB")
+                await buffer.write(chunk)
+        if total == 0:
+            raise HTTPException(status_code=400, detail="上传的文件为空")
+    except BaseException:
+        # 校验失败或写入出错时删除不完整的临时文件
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
 
 @app.post("/api/upload-excel")
 async def upload_excel(file: UploadFile = File(...)):
@@ -100,19 +284,18 @@ async def upload_excel(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="请上传Excel文件(.xlsx或.xls)")
         
         # 生成会话ID
-        session_id = str(uuid.uuid4())
+        session_id = new_id()
         
         # 保存文件到临时目录
         temp_path = path_manager.get_temp_path(f"{session_id}_{file.filename}")
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await _save_upload(file, temp_path)
         
         # 创建对话服务并加载Excel
         dialogue_service = DialogueService()
-        result = dialogue_service.load_excel(temp_path)
+        result = await asyncio.get_running_loop().run_in_executor(EXECUTOR, dialogue_service.load_excel, temp_path)
         
         # 保存会话
-        sessions[session_id] = dialogue_service
+        sessions.set(session_id, dialogue_service)
         
         logger.info(f"Excel文件上传成功: {file.filename}, 会话ID: {session_id}")
         
@@ -123,6 +306,8 @@ async def upload_excel(file: UploadFile = File(...)):
             "message": result
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Excel上传失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -131,17 +316,22 @@ async def upload_excel(file: UploadFile = File(...)):
 async def chat(request: ChatMessage):
     """处理聊天消息"""
     try:
-        session_id = request.session_id
-        if session_id not in sessions:
+        # 处理期间固定会话，避免耗时较长的请求进行中被闲置回收
+        dialogue_service = sessions.acquire(request.session_id)
+        if dialogue_service is None:
             raise HTTPException(status_code=404, detail="会话不存在，请先上传Excel文件")
         
-        dialogue_service = sessions[session_id]
-        response = dialogue_service.process_message(request.message)
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(
+                EXECUTOR, dialogue_service.process_message, request.message
+            )
+        finally:
+            sessions.release(request.session_id)
         
         return {
             "success": True,
             "response": response,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": _now_iso()
         }
         
     except Exception as e:
@@ -149,23 +339,30 @@ async def chat(request: ChatMessage):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/generate-ppt")
-async def generate_ppt(request: PPTGenerateRequest, background_tasks: BackgroundTasks):
+async def generate_ppt(request: PPTGenerateRequest):
     """生成PPT（异步）"""
     try:
         session_id = request.session_id
-        if session_id not in sessions:
+        # 入队前取出会话并固定，排队和生成期间都不会被闲置回收，由后台任务结束时释放
+        dialogue_service = sessions.acquire(session_id)
+        if dialogue_service is None:
             raise HTTPException(status_code=404, detail="会话不存在，请先上传Excel文件")
         
-        # 生成任务ID
-        task_id = str(uuid.uuid4())
-        
-        # 在后台执行PPT生成
-        background_tasks.add_task(
-            generate_ppt_task, 
-            task_id, 
-            session_id, 
-            request.message
-        )
+        try:
+            # 生成任务ID
+            task_id = new_id()
+            # 先登记初始状态，客户端拿到task_id后即可查询或订阅
+            _publish_task_status(task_id, {
+                "status": "queued",
+                "progress": 0,
+                "message": "PPT生成任务排队中..."
+            })
+            
+            # 在后台执行PPT生成
+            spawn(generate_ppt_task(task_id, session_id, dialogue_service, request.message))
+        except Exception:
+            sessions.release(session_id)
+            raise
         
         return {
             "success": True,
@@ -177,96 +374,186 @@ async def generate_ppt(request: PPTGenerateRequest, background_tasks: Background
         logger.error(f"PPT生成启动失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# 任务状态存储
-task_status: Dict[str, Dict] = {}
-
-async def generate_ppt_task(task_id: str, session_id: str, message: str):
-    """后台PPT生成任务"""
+def _publish_task_status(task_id: str, status: Dict[str, Any]) -> None:
+    """保存任务状态的序列化结果：状态变化时序列化一次，轮询接口直接返回缓存的JSON字节；并通知订阅者"""
+    task_status.set(task_id, orjson.dumps(status))
+    event = _task_events.pop(task_id, None)
+    if status["status"] not in TASK_FINAL_STATES:
+        _task_events[task_id] = asyncio.Event()
+    if event is not None:
+        event.set()
+
+async def generate_ppt_task(task_id: str, session_id: str, dialogue_service: DialogueService, message: str):
+    """后台PPT生成任务（同时运行的数量受PPT_SEMAPHORE限制，其余任务保持queued状态排队）。会话已由调用方固定，结束时释放"""
     try:
-        task_status[task_id] = {
-            "status": "processing",
-            "progress": 0,
-            "message": "正在生成PPT..."
-        }
-        
-        dialogue_service = sessions[session_id]
-        
-        # 更新进度
-        task_status[task_id]["progress"] = 30
-        task_status[task_id]["message"] = "正在分析数据..."
-        
-        # 生成PPT
-        result = dialogue_service.process_message(message, generate_ppt=True)
+        async with PPT_SEMAPHORE:
+            status = {
+                "status": "processing",
+                "progress": 0,
+                "message": "正在生成PPT..."
+            }
+            _publish_task_status(task_id, status)
+            
+            # 更新进度
+            status["progress"] = 30
+            status["message"] = "正在分析数据..."
+            _publish_task_status(task_id, status)
+            
+            # 生成PPT（耗时较长，放到独立线程执行，不占用聊天线程池）
+            result = await asyncio.to_thread(dialogue_service.generate_ppt, message)
         
         # 更新进度
-        task_status[task_id]["progress"] = 100
-        task_status[task_id]["status"] = "completed"
-        task_status[task_id]["message"] = result
-        
-        # 提取文件路径
-        if "文件路径：" in result:
-            file_path = result.split("文件路径：")[1].split("\n")[0].strip()
-            task_status[task_id]["file_path"] = file_path
+        status["progress"] = 100
+        status["status"] = "completed"
+        status["message"] = result.text
+        if result.file_path:
+            status["file_path"] = result.file_path
+            # 同名文件被覆盖时目录mtime不变，显式使文件列表缓存失效
+            _invalidate_output_files_cache()
+        _publish_task_status(task_id, status)
         
     except Exception as e:
-        task_status[task_id] = {
+        _publish_task_status(task_id, {
             "status": "failed",
             "progress": 0,
             "message": f"PPT生成失败: {str(e)}"
-        }
+        })
         logger.error(f"PPT生成任务失败: {e}")
+    finally:
+        sessions.release(session_id)
 
 @app.get("/api/task-status/{task_id}")
 async def get_task_status(task_id: str):
-    """获取任务状态"""
-    if task_id not in task_status:
+    """获取任务状态（只查内存，保持async直接在事件循环中完成，省去线程池调度）"""
+    payload = task_status.get(task_id)
+    if payload is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return task_status[task_id]
+    return Response(content=payload, media_type="application/json")
+
+# 输出文件列表缓存：{ "mtime": 输出目录的st_mtime_ns, "payload": 序列化后的响应JSON, "gzip_payload": 预压缩的JSON或None }
+_output_files_cache: Dict[str, Any] = {"mtime": None, "payload": b"", "gzip_payload": None}
+
+# 响应体小于该大小时不压缩（压缩收益抵不过gzip头部开销）
+GZIP_MIN_SIZE = 512
+
+def _invalidate_output_files_cache() -> None:
+    _output_files_cache["mtime"] = None
+
+def _scan_output_files(output_dir: Path) -> List[Dict[str, Any]]:
+    """扫描输出目录中的PPT文件：os.scandir一次遍历，每个文件只stat一次，按创建时间降序排列"""
+    entries = []
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".pptx") and entry.is_file():
+                entries.append((entry.name, entry.stat()))
+    entries.sort(key=lambda item: item[1].st_ctime, reverse=True)
+    return [
+        {
+            "filename": name,
+            "size": st.st_size,
+            "created_time": _utc_iso(st.st_ctime),
+            "download_url": f"/api/download/{name}"
+        }
+        for name, st in entries
+    ]
+
+@app.websocket("/ws/task-status/{task_id}")
+async def task_status_ws(websocket: WebSocket, task_id: str):
+    """推送任务状态：连接后立即发送当前状态，之后每次状态变化推送一次，任务结束后关闭连接"""
+    await websocket.accept()
+    try:
+        while True:
+            # 先取通知事件再读状态，读取之后发生的更新一定会触发该事件
+            event = _task_events.get(task_id)
+            payload = task_status.get(task_id)
+            if payload is None:
+                await websocket.close(code=4404, reason="任务不存在")
+                return
+            await websocket.send_text(payload.decode())
+            if event is None:
+                # 任务已结束，不会再有更新
+                break
+            try:
+                await asyncio.wait_for(event.wait(), timeout=JANITOR_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                # 长时间无更新时重新读取一次，顺带确认任务状态仍然存在
+                pass
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 @app.get("/api/output-files")
-async def list_output_files():
+async def list_output_files(request: Request):
     """获取输出文件列表"""
     try:
-        files = []
-        output_dir = path_manager.get_resource_path("output")
-        
-        if output_dir.exists():
-            for file_path in output_dir.glob("*.pptx"):
-                stat = file_path.stat()
-                files.append({
-                    "filename": file_path.name,
-                    "size": stat.st_size,
-                    "created_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                    "download_url": f"/api/download/{file_path.name}"
-                })
-        
-        # 按创建时间降序排列
-        files.sort(key=lambda x: x["created_time"], reverse=True)
-        
-        return {"files": files}
+        # 与下载接口使用同一个输出目录
+        output_dir = path_manager.get_output_dir()
+        # 目录mtime未变化（没有文件增删）时直接返回缓存的JSON；先取mtime再扫描，扫描期间的变化会在下次请求时重建
+        mtime = os.stat(output_dir).st_mtime_ns
+        if mtime != _output_files_cache["mtime"]:
+            # 目录遍历放到线程中执行，不阻塞事件循环
+            files = await asyncio.to_thread(_scan_output_files, output_dir)
+            payload = orjson.dumps({"files": files})
+            # 只在缓存重建时压缩一次，之后所有命中缓存的请求直接返回压缩好的字节
+            _output_files_cache["gzip_payload"] = gzip.compress(payload, 6) if len(payload) >= GZIP_MIN_SIZE else None
+            _output_files_cache["payload"] = payload
+            _output_files_cache["mtime"] = mtime
+
+        gzip_payload = _output_files_cache["gzip_payload"]
+        if gzip_payload is not None and "gzip" in request.headers.get("accept-encoding", "").lower():
+            return Response(
+                content=gzip_payload,
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+            )
+        return Response(content=_output_files_cache["payload"], media_type="application/json",
+                        headers={"Vary": "Accept-Encoding"})
         
     except Exception as e:
         logger.error(f"获取文件列表失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _resolve_download_path(filename: str) -> Optional[Path]:
+    """
+    将下载文件名解析为输出目录中的路径，文件名不合法时返回None。
+    只校验路径结构而不限制字符，生成的文件名可以包含括号、全角标点等任意字符：
+    必须是单独的文件名（不含路径分隔符和..），以.pptx结尾，且解析后仍位于输出目录内。
+    """
+    if (not filename or Path(filename).name != filename or ".." in filename
+            or "/" in filename or "\\" in filename or not filename.endswith(".pptx")):
+        return None
+    output_dir = path_manager.get_output_dir().resolve()
+    file_path = (output_dir / filename).resolve()
+    if file_path.parent != output_dir:
+        return None
+    return file_path
+
 @app.get("/api/download/{filename}")
-async def download_file(filename: str):
-    """下载PPT文件"""
-    file_path = path_manager.get_output_path(filename)
+def download_file(filename: str):
+    """下载PPT文件（同步处理函数：stat文件在线程池中执行，不阻塞事件循环）"""
+    file_path = _resolve_download_path(filename)
+    if file_path is None:
+        raise HTTPException(status_code=400, detail="文件名不合法")
     
-    if not file_path.exists():
+    # 只stat一次：既判断文件是否存在，又直接用于生成Content-Length等响应头
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    if not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    return FileResponse(
+    return ZeroCopyFileResponse(
         path=str(file_path),
         filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        media_type=PPTX_MEDIA_TYPE,
+        stat_result=stat_result
     )
 
 @app.post("/api/config")
-async def update_config(config: ConfigUpdate):
-    """更新配置"""
+def update_config(config: ConfigUpdate):
+    """更新配置（同步处理函数：写配置文件、重建LLM客户端在线程池中执行）"""
     try:
         config_manager.set_openai_config(
             config.api_key,
@@ -278,7 +565,6 @@ async def update_config(config: ConfigUpdate):
             config_manager.apply_to_environment()
             
             # 重新初始化所有现有会话的LLM客户端
-            from llm_client import OpenAIConnector
             llm_client = OpenAIConnector.get_instance()
             llm_client.reinitialize_client()
             
@@ -292,7 +578,7 @@ async def update_config(config: ConfigUpdate):
 
 @app.get("/api/config")
 async def get_config():
-    """获取当前配置"""
+    """获取当前配置（只读内存中的配置，保持async直接在事件循环中完成）"""
     try:
         openai_config = config_manager.get_openai_config()
         ui_config = config_manager.get_ui_config()
@@ -320,8 +606,8 @@ async def get_config():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/logs/llm")
-async def get_llm_logs(limit: int = 50):
-    """获取LLM交互日志"""
+def get_llm_logs(limit: int = 50):
+    """获取LLM交互日志（同步处理函数：读日志文件在线程池中执行）"""
     try:
         log_file_path = path_manager.get_log_path('llm_interactions.log')
         
@@ -353,10 +639,11 @@ async def get_llm_logs(limit: int = 50):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/session/{session_id}")
-async def clear_session(session_id: str):
-    """清除会话"""
-    if session_id in sessions:
-        del sessions[session_id]
+def clear_session(session_id: str):
+    """清除会话（同步处理函数：关闭数据库连接在线程池中执行）"""
+    dialogue_service = sessions.pop(session_id)
+    if dialogue_service is not None:
+        dialogue_service.close()
         return {"success": True, "message": "会话已清除"}
     else:
         raise HTTPException(status_code=404, detail="会话不存在")
@@ -367,7 +654,7 @@ async def get_table_data(data_id: str):
     try:
         # 尝试从所有会话中查找表格数据
         table_data = None
-        for session_id, service in sessions.items():
+        for service in sessions.values():
             if hasattr(service, 'message_var_processor'):
                 data = service.message_var_processor.get_table_data_for_copy(data_id)
                 if data:
@@ -391,7 +678,41 @@ async def get_table_data(data_id: str):
 
 # 挂载静态文件
 static_dir = path_manager.get_resource_path("static")
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+
+# 主页面中引用本地静态资源的属性，如 href="/static/styles.css"
+_STATIC_REF_RE = re.compile(rb'((?:href|src)="/static/)([\w\-./]+)(")')
+
+def _versioned_index_html(html: bytes) -> bytes:
+    """
+    给主页面引用的静态资源URL加上内容哈希参数（?v=...）。
+    资源内容变化时URL随之变化，因此带版本参数的资源可以被浏览器永久缓存。
+    """
+    def add_version(match: "re.Match[bytes]") -> bytes:
+        asset_path = Path(static_dir) / match.group(2).decode()
+        try:
+            digest = hashlib.blake2b(asset_path.read_bytes(), digest_size=8).hexdigest()
+        except OSError:
+            return match.group(0)
+        return match.group(1) + match.group(2) + b"?v=" + digest.encode() + match.group(3)
+
+    return _STATIC_REF_RE.sub(add_version, html)
+
+class CachedStaticFiles(StaticFiles):
+    """
+    静态文件服务，附加缓存控制头：
+    - 带版本参数（?v=）的请求：URL随内容变化，可永久缓存，重复访问不再发请求
+    - 其他请求：每次向服务器确认，StaticFiles根据ETag/Last-Modified在内容未变时直接返回304
+    """
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if "v" in parse_qs(scope.get("query_string", b"").decode("latin-1")):
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            else:
+                response.headers["Cache-Control"] = "no-cache"
+        return response
+
+app.mount("/static", CachedStaticFiles(directory=static_dir), name="static")
 
 if __name__ == "__main__":
     import uvicorn
@@ -403,11 +724,17 @@ if __name__ == "__main__":
     print("🚀 启动PPT生成工具Web服务...")
     print("📱 请在浏览器中访问: http://localhost:8000")
     
+    # loop/http为auto时，uvicorn[standard]已安装的uvloop和httptools会被自动选用（Windows上退回asyncio）。
+    # 只能单进程运行：会话、任务状态和WebSocket通知都保存在进程内存中，多个worker之间不共享，
+    # 要开启多worker需先把这些状态迁移到外部存储（如Redis）。
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=8000,
         reload=False,
+        loop="auto",
+        http="auto",
+        workers=1,
         log_level="info",
         log_config=None
     )